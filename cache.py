@@ -0,0 +1,159 @@
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+import numpy as np
+
+if TYPE_CHECKING:
+    from simulation import Simulation
+
+# Bump when the stored layout changes; stale entries then stop matching
+CACHE_FORMAT = 1
+# Modules whose code decides the simulated arrays
+SOURCE_MODULES = ("distribution.py", "draws.py", "schedule.py", "simulation.py")
+
+def code_version() -> str:
+    """Hash of the cache format and the sources of SOURCE_MODULES, so edits to the model invalidate old entries."""
+    digest = hashlib.sha256(str(CACHE_FORMAT).encode())
+    root = Path(__file__).resolve().parent
+    for name in SOURCE_MODULES:
+        digest.update((root / name).read_bytes())
+    return digest.hexdigest()[:16]
+
+def fingerprint(sim: "Simulation", number_of_runs: int | None, spawn: bool, version: str,
+                target: dict[str, Any] | None = None) -> str:
+    """
+    Stable hash of everything that decides the runs of sim: the fields Simulation.__eq__ compares,
+    the storage dtype, the number of runs, which random streams are used (serial per_run seeds
+    or spawned child streams, and whether draws come from a DrawBank) and the code version.
+    For runs of Simulation.simulate_until the number of runs is not known up front: target holds
+    its stopping rule instead.
+    """
+    fields: dict[str, Any] = {
+        "working_hours": sim.working_hours,
+        "scheduled_arrival": sim.scheduled_arrival,
+        "mean_service_time": sim.mean_service_time,
+        "doctors": sim.doctors,
+        # json has no infinity
+        "queue_capacity": "inf" if math.isinf(sim.queue_capacity) else sim.queue_capacity,
+        "number_of_patients": sim.number_of_patients,
+        "iat_distribution": (sim.iat_distribution.mu, sim.iat_distribution.sigma),
+        "service_distribution": (sim.service_distribution.mu, sim.service_distribution.sigma),
+        "cost_params": list(sim.cost_params),
+        "appointment_times": None if sim.appointment_times is None else sim.appointment_times.tolist(),
+        "seed": sim.seed,
+        "sampling": sim.sampling,
+        "antithetic": sim.antithetic,
+        "tilt": sim.tilt,
+        "storage_dtype": np.dtype(sim.storage_dtype).name,
+        "number_of_runs": number_of_runs,
+        # batch sampling always uses child streams
+        "spawn": spawn and sim.sampling == "per_run",
+        # workers sample their own draws; only serial runs map the bank's normals
+        "draw_bank": sim.draws is not None and not spawn,
+        "version": version,
+    }
+    if target is not None:
+        fields["target"] = target
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+def write_npz(path: Path, **arrays: Any) -> None:
+    """np.savez to a temporary file, then rename, so readers never see half a file."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+class ResultCache:
+    """
+    On-disk cache of simulated runs, shared between processes and sessions.
+
+    An entry holds the stored arrays of a Simulation (see ScheduleBatch.to_batch) in one
+    uncompressed .npz file, named by the fingerprint of the configuration and number of runs.
+    Rerunning an unchanged configuration then only reads the arrays back.
+
+    The directory is kept under max_bytes by evicting the least recently used entries
+    (every load touches its file). Other files in the directory (e.g. of a Checkpoint) are never touched.
+    """
+    ENTRY = re.compile(r"[0-9a-f]{64}\.npz")
+    def __init__(self, directory: str = "out/cache", max_bytes: int = 2 * 1024 ** 3):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.version = code_version()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, sim: "Simulation", number_of_runs: int | None, spawn: bool, target: dict[str, Any] | None = None) -> str:
+        """Content address of number_of_runs fresh runs of sim, or of the runs until target (see fingerprint)."""
+        return fingerprint(sim, number_of_runs, spawn, self.version, target)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.npz"
+
+    @staticmethod
+    def cacheable(sim: "Simulation") -> bool:
+        """Only seeded simulations without runs yet repeat exactly."""
+        return sim.seed is not None and sim.streams_used == 0 and not len(sim.schedules) and sim.accumulator is None
+
+    def load(self, sim: "Simulation", number_of_runs: int | None, spawn: bool, target: dict[str, Any] | None = None) -> bool:
+        """Store the cached runs in sim, as simulate() would have; returns False on a miss."""
+        if not self.cacheable(sim):
+            return False
+        path = self._path(self.key(sim, number_of_runs, spawn, target))
+        try:
+            with np.load(path) as entry:
+                batch = {name: entry[name] for name in entry.files if name != "streams_used"}
+                streams_used = int(entry["streams_used"])
+        except (OSError, ValueError, KeyError):
+            # Missing, evicted meanwhile or partly written by an older version
+            self.misses += 1
+            return False
+        os.utime(path)  # recently used
+        sim._store_batch(batch)
+        sim.streams_used = streams_used
+        self.hits += 1
+        return True
+
+    def save(self, sim: "Simulation", number_of_runs: int | None, spawn: bool, target: dict[str, Any] | None = None) -> None:
+        """Write the runs of a freshly simulated sim, then evict down to max_bytes."""
+        if sim.seed is None or sim.accumulator is not None:
+            return
+        write_npz(self._path(self.key(sim, number_of_runs, spawn, target)), streams_used=sim.streams_used, **sim.schedules.to_batch())
+        self.evict()
+
+    def _entries(self) -> list[Path]:
+        return [path for path in self.directory.glob("*.npz") if self.ENTRY.fullmatch(path.name)]
+
+    def evict(self) -> None:
+        """Delete least recently used entries until the directory fits in max_bytes."""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    @property
+    def nbytes(self) -> int:
+        """Size of all entries on disk."""
+        return sum(path.stat().st_size for path in self._entries())
+
+    def clear(self) -> None:
+        for path in self._entries():
+            path.unlink(missing_ok=True)
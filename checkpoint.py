@@ -0,0 +1,149 @@
+import json
+import re
+from pathlib import Path
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING, Any, Iterator
+import numpy as np
+from cache import code_version, fingerprint, write_npz
+
+if TYPE_CHECKING:
+    from simulation import Simulation
+
+class Checkpoint:
+    """
+    Progress of a long Optimisation on disk, so that a killed job can pick up where it stopped
+    (Optimisation(checkpoint_dir=..., resume=True)).
+
+    Every chunk of runs (see Simulation._stream_groups) is written as soon as it is done, as a
+    .npz file named by the simulation's fingerprint (without run count) and the first random
+    stream it used. A resumed job makes the same calls in the same order: chunks found on disk
+    are read back instead of simulated and the rest continues from the next stream, so the runs,
+    and everything computed from them, are identical to an uninterrupted job. Precision-driven
+    runs (Simulation.simulate_until) read and write their chunks through iter_groups. Results that are
+    not runs (control-variate comparisons) are kept as JSON. Nothing is pickled.
+
+    manifest.json holds the Optimisation parameters and the code version; resuming with other
+    ones raises a ValueError. Without resume the checkpoint starts over: its own files (see OWN_FILES)
+    are deleted, anything else in the directory, e.g. a ResultCache sharing it, is left alone.
+    """
+    MANIFEST = "manifest.json"
+    # Chunks (fingerprint-stream.npz) and results (fingerprint-kind-options.json) written by a checkpoint
+    OWN_FILES = re.compile(r"[0-9a-f]{64}-(\d{8}\.npz|.+\.json)")
+
+    def __init__(self, directory: str, parameters: dict[str, Any], resume: bool = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.version = code_version()
+        # json round trip so tuples compare equal to the lists read back
+        manifest = json.loads(json.dumps({"parameters": parameters, "version": self.version}))
+        path = self.directory / self.MANIFEST
+        if resume and path.exists():
+            if json.loads(path.read_text()) != manifest:
+                raise ValueError(f"Checkpoint in {self.directory} was written with other parameters or code; cannot resume.")
+        else:
+            self.clear()
+            path.write_text(json.dumps(manifest, indent=2))
+        self.restored_runs = 0  # runs read back instead of simulated
+
+    def _part(self, key: str, start: int) -> Path:
+        return self.directory / f"{key}-{start:08d}.npz"
+
+    def restore(self, sim: "Simulation", number_of_runs: int, spawn: bool, keep_schedules: bool = True) -> int:
+        """
+        Add the chunks of the next number_of_runs runs of sim that are on disk, as simulate()
+        would have; returns how many runs are still to simulate.
+        """
+        sim._start_runs(keep_schedules)
+        if sim.seed is None:
+            # Unseeded runs cannot be repeated, so they are not checkpointed
+            return number_of_runs
+        key = fingerprint(sim, None, spawn, self.version)
+        while number_of_runs > 0:
+            path = self._part(key, sim.streams_used)
+            if not path.exists():
+                break
+            with np.load(path) as part:
+                batch = {name: part[name] for name in part.files if name != "streams"}
+                streams = int(part["streams"])
+            runs = len(batch["doctor_idle_times"])
+            if runs > number_of_runs:
+                # chunked differently than now: simulate instead
+                break
+            sim._add_batch(batch, keep_schedules)
+            sim.streams_used += streams
+            number_of_runs -= runs
+            self.restored_runs += runs
+        return number_of_runs
+
+    def iter_groups(self, sim: "Simulation", groups: list[list[tuple[int, Any]]], start: int,
+                    workers: int | None = None, pool: Executor | None = None) -> Iterator[dict[str, np.ndarray]]:
+        """
+        sim._iter_groups(groups, workers, pool) for chunks that use the streams from `start` on:
+        chunks on disk with the same streams are read back, the others simulated and written.
+        """
+        spawn = workers is not None
+        key = fingerprint(sim, None, spawn, self.version) if sim.seed is not None else None
+        starts = np.cumsum([start] + [len(group) for group in groups[:-1]]).tolist()
+        stored = [self._read(key, first, group) if key is not None else None for first, group in zip(starts, groups)]
+        fresh = sim._iter_groups([group for group, batch in zip(groups, stored) if batch is None], workers, pool)
+        for first, group, batch in zip(starts, groups, stored):
+            if batch is None:
+                batch = next(fresh)
+                self.store(sim, first, len(group), batch, spawn)
+            else:
+                self.restored_runs += len(batch["doctor_idle_times"])
+            yield batch
+
+    def _read(self, key: str, start: int, group: list[tuple[int, Any]]) -> dict[str, np.ndarray] | None:
+        """The chunk written for exactly these streams from stream `start` on, if it is on disk."""
+        path = self._part(key, start)
+        if not path.exists():
+            return None
+        with np.load(path) as part:
+            if int(part["streams"]) != len(group) or len(part["doctor_idle_times"]) != sum(runs for runs, _ in group):
+                # chunked differently (e.g. by simulate()): simulate instead
+                return None
+            return {name: part[name] for name in part.files if name != "streams"}
+
+    def store(self, sim: "Simulation", start: int, streams: int, batch: dict[str, np.ndarray], spawn: bool) -> None:
+        """Write one finished chunk of runs that used `streams` streams from stream `start` on."""
+        if sim.seed is not None:
+            write_npz(self._part(fingerprint(sim, None, spawn, self.version), start), streams=streams, **batch)
+
+    def simulate(self, sim: "Simulation", number_of_runs: int, workers: int | None = None,
+                 keep_schedules: bool = True) -> None:
+        """sim.simulate(number_of_runs, workers, keep_schedules), reading back and writing chunks as it goes."""
+        spawn = workers is not None
+        remaining = self.restore(sim, number_of_runs, spawn, keep_schedules)
+        if remaining <= 0:
+            return
+        start = sim.streams_used
+        groups = sim._stream_groups(remaining, spawn)
+        for group, batch in zip(groups, sim._iter_groups(groups, workers)):
+            sim._add_batch(batch, keep_schedules)
+            self.store(sim, start, len(group), batch, spawn)
+            start += len(group)
+
+    def _result_path(self, name: str) -> Path:
+        return self.directory / f"{name}.json"
+
+    def result_name(self, sim: "Simulation", kind: str, **options: Any) -> str:
+        """File name for a non-run result of sim, e.g. result_name(sim, "cv", num_runs=1000)."""
+        suffix = "-".join(f"{option}{value}" for option, value in sorted(options.items()))
+        return f"{fingerprint(sim, None, False, self.version)}-{kind}-{suffix}"
+
+    def load_result(self, name: str) -> dict[str, Any] | None:
+        path = self._result_path(name)
+        return json.loads(path.read_text()) if path.exists() else None
+
+    def store_result(self, name: str, result: dict[str, Any]) -> None:
+        path = self._result_path(name)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(result))
+        tmp.replace(path)
+
+    def clear(self) -> None:
+        """Delete the chunks, results and manifest of checkpoints in the directory, and nothing else."""
+        for path in self.directory.iterdir():
+            if path.name == self.MANIFEST or self.OWN_FILES.fullmatch(path.name):
+                path.unlink(missing_ok=True)
@@ -30,9 +30,25 @@ class Lognormal:
     def variance(self) -> float:
         return (math.exp(self.sigma ** 2) - 1) * math.exp(2 * self.mu + self.sigma ** 2)
 
-    def sample(self, size: int=1, seed: int | None=None) -> np.ndarray:
+    def sample(self, size: int=1, seed: int | np.random.SeedSequence | None=None) -> np.ndarray:
         rng = np.random.default_rng(seed)
         return rng.lognormal(mean=self.mu, sigma=self.sigma, size=size)
+
+    def sample_batch(self, runs: int, patients: int, rng: np.random.Generator | np.random.SeedSequence | int | None=None) -> np.ndarray:
+        """
+        Generate a (runs x patients) matrix of samples from a single generator.
+        Pass the same Generator to several calls to keep drawing from one stream.
+        """
+        rng = np.random.default_rng(rng)
+        return rng.lognormal(mean=self.mu, sigma=self.sigma, size=(runs, patients))
+
+    def from_standard_normal(self, z: np.ndarray) -> np.ndarray:
+        """
+        Map standard normal draws to samples: exp(mu + sigma * z) is what sample() draws from the
+        same normals (up to rounding in exp). Since the CV is fixed, only mu depends on the mean,
+        so one set of normals serves every desired_mean (common random numbers).
+        """
+        return np.exp(self.mu + self.sigma * z)
     
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Lognormal):
@@ -109,6 +125,22 @@ class TruncatedNormal:
             return self.mu + self.sigma * (phi_alpha - phi_beta) / Z
         return self.mu
 
+    def clipped_mean(self) -> float:
+        """
+        Mean of the samples: sample() clips to the bounds instead of truncating, so values beyond
+        them pile up at the bounds and the mean differs from mean().
+        """
+        alpha = (self.LOWER_BOUND - self.mu) / self.sigma
+        beta = (self.UPPER_BOUND - self.mu) / self.sigma
+
+        phi_alpha = (1 / math.sqrt(2 * math.pi)) * math.exp(-0.5 * alpha ** 2)
+        phi_beta = (1 / math.sqrt(2 * math.pi)) * math.exp(-0.5 * beta ** 2)
+        cdf_alpha = 0.5 * (1 + math.erf(alpha / math.sqrt(2)))
+        cdf_beta = 0.5 * (1 + math.erf(beta / math.sqrt(2)))
+
+        inside = self.mu * (cdf_beta - cdf_alpha) + self.sigma * (phi_alpha - phi_beta)
+        return self.LOWER_BOUND * cdf_alpha + inside + self.UPPER_BOUND * (1 - cdf_beta)
+
     def variance(self) -> float:
         """Variance of the truncated normal distribution."""
         alpha = (self.LOWER_BOUND - self.mu) / self.sigma
@@ -125,7 +157,7 @@ class TruncatedNormal:
             return self.sigma ** 2 * (1 + term1 - term2)
         return self.sigma ** 2
 
-    def sample(self, size: int = 1, seed: int | None = None) -> np.ndarray:
+    def sample(self, size: int = 1, seed: int | np.random.SeedSequence | None = None) -> np.ndarray:
         """
         Generate samples from the truncated normal distribution.
         Uses numpy's clip to truncate values to [LOWER_BOUND, UPPER_BOUND].
@@ -133,6 +165,19 @@ class TruncatedNormal:
         rng = np.random.default_rng(seed)
         samples = rng.normal(loc=self.mu, scale=self.sigma, size=size)
         return np.clip(samples, self.LOWER_BOUND, self.UPPER_BOUND)
+
+    def sample_batch(self, runs: int, patients: int, rng: np.random.Generator | np.random.SeedSequence | int | None = None) -> np.ndarray:
+        """
+        Generate a (runs x patients) matrix of samples from a single generator.
+        Pass the same Generator to several calls to keep drawing from one stream.
+        """
+        rng = np.random.default_rng(rng)
+        samples = rng.normal(loc=self.mu, scale=self.sigma, size=(runs, patients))
+        return np.clip(samples, self.LOWER_BOUND, self.UPPER_BOUND)
+
+    def from_standard_normal(self, z: np.ndarray) -> np.ndarray:
+        """Map standard normal draws to samples, exactly as sample() does with the same normals."""
+        return np.clip(self.mu + self.sigma * z, self.LOWER_BOUND, self.UPPER_BOUND)
     
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, TruncatedNormal):
@@ -0,0 +1,78 @@
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+# A random stream as used by Simulation._streams: (runs in stream, seed)
+Stream = tuple[int, int | np.random.SeedSequence | None]
+
+class DrawBank:
+    """
+    Common random numbers shared by many simulations.
+
+    Both samplers of a run are seeded alike, so service times and unpunctuality are two
+    transforms of the same standard normal draws. The bank generates the (runs x patients)
+    matrix of standard normals for a set of random streams once, and every simulation with
+    the same seed and number of runs maps it through its own distributions
+    (see Lognormal.from_standard_normal). A sweep over scheduled_arrival or mean_service_time
+    therefore samples once, and all candidates see the same randomness.
+
+    Matrices are keyed by (sampling, streams, patients). With per_run sampling the first k
+    normals of a run do not depend on how many are drawn, so a request for fewer patients
+    is a column slice of an existing matrix (as in mean_service_time sweeps, where the
+    number of patients changes with the mean). Batch sampling fills the matrix row by row,
+    and rqmc sampling uses one Sobol dimension per patient, so there each number of patients
+    is its own entry.
+    """
+    def __init__(self):
+        self.normals: dict[tuple, np.ndarray] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _stream_key(seed: int | np.random.SeedSequence | None) -> int | tuple | None:
+        if isinstance(seed, np.random.SeedSequence):
+            return (seed.entropy, seed.spawn_key)
+        return seed
+
+    def standard_normals(self, streams: list[Stream], patients: int, sampling: str) -> np.ndarray:
+        """(runs x patients) standard normals for the given streams, generated on first use."""
+        stream_keys = tuple((runs, self._stream_key(seed)) for runs, seed in streams)
+        if any(seed is None for _, seed in streams):
+            # Unseeded streams are fresh randomness every time: nothing to share
+            return self.generate(streams, patients, sampling)
+
+        key = (sampling, stream_keys) if sampling == "per_run" else (sampling, stream_keys, patients)
+        normals = self.normals.get(key)
+        if normals is not None and normals.shape[1] >= patients:
+            self.hits += 1
+            return normals[:, :patients]
+
+        self.misses += 1
+        normals = self.generate(streams, patients, sampling)
+        self.normals[key] = normals
+        return normals
+
+    @staticmethod
+    def generate(streams: list[Stream], patients: int, sampling: str) -> np.ndarray:
+        """(runs x patients) standard normals for the given streams, as the samplers draw them (not banked)."""
+        if sampling == "rqmc":
+            # One scrambled Sobol randomization of `runs` points per stream, mapped to normals
+            return np.concatenate([
+                ndtri(qmc.Sobol(patients, rng=np.random.default_rng(seed)).random(runs)) for runs, seed in streams
+            ])
+        if sampling == "batch":
+            return np.concatenate([
+                np.random.default_rng(seed).standard_normal((runs, patients)) for runs, seed in streams
+            ])
+        normals = np.empty((len(streams), patients))
+        for row, (_, seed) in enumerate(streams):
+            normals[row] = np.random.default_rng(seed).standard_normal(patients)
+        return normals
+
+    def clear(self) -> None:
+        self.normals.clear()
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the banked matrices."""
+        return sum(normals.nbytes for normals in self.normals.values())
@@ -24,6 +24,9 @@ if __name__ == "__main__":
     # "mean_service_time"
     # "cost_params"
     VARIABLE = "scheduled_arrival"  # Variable to optimize for
+    # HOW TO SEARCH: "grid" simulates every integer offset in RANGE,
+    # "golden" searches the continuous RANGE (scheduled_arrival / mean_service_time only)
+    METHOD = "grid"
     SENSITIVITY_ANALYSIS = True  # Set to True to perform sensitivity analysis around optimal value
 
     # SAVE TO DATABASE --- OPTIONAL ---
@@ -40,6 +43,17 @@ if __name__ == "__main__":
     # Set to None for random behavior
     SEED = 0
 
+    # CACHE OF SIMULATED RUNS
+    # Seeded runs are saved here and read back when the same configuration is run again
+    # Set to None to always simulate
+    CACHE_DIR = "out/cache"
+
+    # CHECKPOINTS OF A LONG RUN
+    # Finished runs are written here as they complete; if a run is killed,
+    # set RESUME = True to continue where it stopped with identical results
+    CHECKPOINT_DIR = f"out/seed{SEED}/checkpoint"
+    RESUME = False
+
     ### END OF CONSTANTS ###
 
     # Initialize optimisation model
@@ -51,11 +65,14 @@ if __name__ == "__main__":
         number_of_runs=NUMBER_OF_RUNS,
         scheduled_arrival=SCHEDULED_ARRIVAL,
         cost_params=COST_PARAMS,
-        seed=SEED
+        seed=SEED,
+        cache_dir=CACHE_DIR,
+        checkpoint_dir=CHECKPOINT_DIR,
+        resume=RESUME
     )
 
     # Run full optimisation to get all metrics
-    model.optimise_for(variable=VARIABLE)
+    model.optimise_for(variable=VARIABLE, method=METHOD if VARIABLE != "cost_params" else "grid")
 
     # Always print summary to console (for all simulations of the optimized variable)
     model.print_summary_to_console(selections={VARIABLE: "all"})
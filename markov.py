@@ -1,41 +1,28 @@
+import numpy as np
 import pandas as pd
 
 class MarkovChain:
     """
     Represents a Markov chain with states and staying times.
     """
-    def __init__(self, states: list[int], staying_times: list[float]):
-        self.states = states
-        self.staying_times = staying_times
-        self.total_time = sum(staying_times)
+    def __init__(self, states: list[int] | np.ndarray, staying_times: list[float] | np.ndarray):
+        self.states = np.asarray(states, dtype=np.int64)
+        self.staying_times = np.asarray(staying_times, dtype=np.float64)
+        self.total_time = float(self.staying_times.sum())
 
     # Note this is equal to L in little's formula
     def get_average_queue_length(self) -> float:
-        weighted_sum = sum(s * t for s, t in zip(self.states, self.staying_times))
+        weighted_sum = float(self.states @ self.staying_times)
         return weighted_sum / self.total_time if self.total_time > 0 else 0
-    
+
     def get_server_idle_time(self, servers: int=1) -> float:
-        idle_time = 0.0
-        for state, time in zip(self.states, self.staying_times):
-            if state < servers:
-                idle_time += (servers - state) * time
-        return idle_time
-    
+        return float(np.maximum(servers - self.states, 0) @ self.staying_times)
+
     def get_patient_waiting_time(self, servers: int=1) -> float:
-        total_waiting_time = 0.0
-        for state, time in zip(self.states, self.staying_times):
-            if state > servers:
-                total_waiting_time += (state - servers) * time
-        return total_waiting_time
-    
+        return float(np.maximum(self.states - servers, 0) @ self.staying_times)
+
     def list_waiting_times(self, servers: int=1) -> list[float]:
-        waiting_times: list[float] = []
-        for state, time in zip(self.states, self.staying_times):
-            if state > servers:
-                waiting_times.append((state - servers) * time)
-            else:
-                waiting_times.append(0.0)
-        return waiting_times
+        return (np.maximum(self.states - servers, 0) * self.staying_times).tolist()
 
     def get_server_overtime(self, working_hours: float, servers: int=1) -> float:
         total_time = self.total_time
@@ -44,17 +31,110 @@ class MarkovChain:
             overtime += max(0.0, total_time - working_hours * 60.0)
             total_time -= self.staying_times[-1 - i]
         return overtime
-    
+
     def get_doctor_utilization(self) -> float:
-        busy_time = 0.0
-        for state, time in zip(self.states, self.staying_times):
-            if state > 0:
-                busy_time += time
-        return (busy_time / self.total_time) * 100  # percentage
-    
+        busy_time = float(self.staying_times[self.states > 0].sum())
+        return (busy_time / self.total_time) * 100 if self.total_time > 0 else 0  # percentage
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "state": self.states,
+            "staying_time": self.staying_times
+        })
+
+class MarkovChainBatch:
+    """
+    The Markov chains of many runs, stored CSR-style: the states and staying times of
+    every run are concatenated into flat arrays, and run r owns the slice
+    offsets[r]:offsets[r + 1]. Every metric method returns one value per run,
+    computed for all runs in one vectorized pass.
+    """
+    def __init__(self, states: np.ndarray, staying_times: np.ndarray, offsets: np.ndarray):
+        self.states = np.asarray(states, dtype=np.int64)
+        self.staying_times = np.asarray(staying_times, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        # run index of every state, used to reduce per run
+        self.run_ids = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        self.total_times = self._per_run(self.staying_times)
+
+    @classmethod
+    def from_times(cls, arrival_times: np.ndarray, service_end_times: np.ndarray) -> "MarkovChainBatch":
+        """
+        Builds the chains of the number of patients in the system from (runs x patients)
+        arrival and service end times; NaN entries (e.g. dropped patients) are left out.
+        Same timeline as Schedule.to_markov_chain: starts at time 0, an arrival is
+        counted before a service end at the same time, and zero-length states are skipped.
+        """
+        arrival_times = np.asarray(arrival_times, dtype=np.float64)
+        service_end_times = np.asarray(service_end_times, dtype=np.float64)
+        runs = len(arrival_times)
+        times = np.concatenate([arrival_times, service_end_times], axis=1)
+        changes = np.concatenate([
+            np.ones(arrival_times.shape, dtype=np.int64), -np.ones(service_end_times.shape, dtype=np.int64)
+        ], axis=1)
+        # stable sort keeps arrivals (first columns) ahead of ends at equal times; NaN sorts last
+        order = np.argsort(times, axis=1, kind="stable")
+        times = np.take_along_axis(times, order, axis=1)
+        changes = np.take_along_axis(changes, order, axis=1)
+        changes[np.isnan(times)] = 0
+
+        # state held over [previous event, this event) is the count before this event
+        in_system = np.cumsum(changes, axis=1)
+        states = np.concatenate([np.zeros((runs, 1), dtype=np.int64), in_system[:, :-1]], axis=1)
+        staying_times = np.diff(times, axis=1, prepend=0.0)
+        keep = staying_times > 0  # also drops the NaN tail
+
+        offsets = np.zeros(runs + 1, dtype=np.int64)
+        np.cumsum(keep.sum(axis=1), out=offsets[1:])
+        return cls(states[keep], staying_times[keep], offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> MarkovChain:
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"Run {index} out of range for {len(self)} runs.")
+        index %= len(self)
+        run = slice(self.offsets[index], self.offsets[index + 1])
+        return MarkovChain(self.states[run], self.staying_times[run])
+
+    def _per_run(self, values: np.ndarray) -> np.ndarray:
+        """Sum of per-state values within each run."""
+        return np.bincount(self.run_ids, weights=values, minlength=len(self))
+
+    def _per_total_time(self, values: np.ndarray) -> np.ndarray:
+        has_time = self.total_times > 0
+        return np.where(has_time, values / np.where(has_time, self.total_times, 1.0), 0.0)
+
+    def get_average_queue_length(self) -> np.ndarray:
+        return self._per_total_time(self._per_run(self.states * self.staying_times))
+
+    def get_server_idle_time(self, servers: int=1) -> np.ndarray:
+        return self._per_run(np.maximum(servers - self.states, 0) * self.staying_times)
+
+    def get_patient_waiting_time(self, servers: int=1) -> np.ndarray:
+        return self._per_run(np.maximum(self.states - servers, 0) * self.staying_times)
+
+    def list_waiting_times(self, servers: int=1) -> np.ndarray:
+        """Waiting time accrued in each state, flat like states (split per run with offsets)."""
+        return np.maximum(self.states - servers, 0) * self.staying_times
+
+    def get_server_overtime(self, working_hours: float, servers: int=1) -> np.ndarray:
+        total_times = self.total_times.copy()
+        overtime = np.zeros(len(self))
+        for i in range(servers):
+            overtime += np.maximum(0.0, total_times - working_hours * 60.0)
+            last = self.offsets[1:] - 1 - i
+            has_state = last >= self.offsets[:-1]
+            total_times[has_state] -= self.staying_times[last[has_state]]
+        return overtime
+
+    def get_doctor_utilization(self) -> np.ndarray:
+        return self._per_total_time(self._per_run(np.where(self.states > 0, self.staying_times, 0.0))) * 100  # percentage
+
     def to_dataframe(self) -> pd.DataFrame:
         return pd.DataFrame({
+            "run_id": self.run_ids,
             "state": self.states,
             "staying_time": self.staying_times
         })
-                
\ No newline at end of file
@@ -1,12 +1,171 @@
-from simulation import Simulation
+from simulation import Simulation, replication_means
 from distribution import Lognormal, TruncatedNormal
 from typing import Any
+import math
+from statistics import NormalDist
 from summary import Summary
 from tqdm import tqdm
 import pandas as pd
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+import itertools
+import numpy as np
+from scipy.optimize import linprog, minimize
+from draws import DrawBank
+from cache import ResultCache
+from checkpoint import Checkpoint
+
+class SweepGrid:
+    """
+    Results of a sweep over several parameters (see Optimisation.optimise_grid).
+
+    Axis k of every array belongs to variables[k] and its positions to values[k]:
+    costs holds the total cost of every cell, simulations and summaries the cell objects.
+    """
+    def __init__(self, variables: list[str], values: list[list[float]]):
+        self.variables = variables
+        self.values = values
+        shape = tuple(len(axis) for axis in values)
+        self.costs = np.full(shape, np.nan)
+        self.simulations = np.empty(shape, dtype=object)
+        self.summaries = np.empty(shape, dtype=object)
+
+    def add(self, index: tuple[int, ...], sim: Simulation, summary: Summary) -> None:
+        self.simulations[index] = sim
+        self.summaries[index] = summary
+        self.costs[index] = summary.averages.total_cost
+
+    def metric(self, section: str, name: str) -> np.ndarray:
+        """Any summary statistic over the grid, e.g. metric("system_metrics", "doctor_utilization")."""
+        return np.vectorize(lambda summary: summary[section][name], otypes=[float])(self.summaries)
+
+    def optimal(self) -> tuple[dict[str, float], float]:
+        """Values of the cheapest cell and its total cost."""
+        index = np.unravel_index(np.nanargmin(self.costs), self.costs.shape)
+        return {variable: self.values[axis][i] for axis, (variable, i) in enumerate(zip(self.variables, index))}, float(self.costs[index])
+
+    def optimal_simulation(self) -> Simulation:
+        return self.simulations[np.unravel_index(np.nanargmin(self.costs), self.costs.shape)]
+
+    def optimum_along(self, var_to_opt: str) -> dict[str, Any]:
+        """
+        For a 2-D grid: the optimal var_to_opt and its cost for every value of the other variable,
+        as keyword arguments of ClinicVisualization.plot_2d_relationship.
+        """
+        if len(self.variables) != 2 or var_to_opt not in self.variables:
+            raise ValueError(f"optimum_along needs a 2-D grid containing '{var_to_opt}'.")
+        opt_axis = self.variables.index(var_to_opt)
+        fixed_axis = 1 - opt_axis
+        costs = np.moveaxis(self.costs, fixed_axis, 0)
+        best = np.nanargmin(costs, axis=1)
+        return {
+            "fixed_vars": list(self.values[fixed_axis]),
+            "opt_vars": [self.values[opt_axis][i] for i in best],
+            "opt_costs": [float(costs[row, i]) for row, i in enumerate(best)],
+            "fixed_var": self.variables[fixed_axis],
+            "var_to_opt": var_to_opt,
+        }
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """One row per cell: the variable values and the total cost."""
+        rows: list[dict[str, Any]] = []
+        for index in np.ndindex(self.costs.shape):
+            row: dict[str, Any] = {variable: self.values[axis][i] for axis, (variable, i) in enumerate(zip(self.variables, index))}
+            row["total_cost"] = self.costs[index]
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+class CostIndex:
+    """
+    Cost components of many candidate configurations, to re-optimise under any cost weights
+    without simulating again.
+
+    Total cost is linear in the weights: idle * c0 + waiting * c1 + overtime * c2, where waiting
+    is the average waiting time per patient times the number of patients. The index keeps the
+    per-run (runs x 3) component arrays of every candidate and their means, so the cost, the
+    optimum and its confidence interval for any weights are a few matrix products.
+    With replication_runs > 1 (antithetic or rqmc sampling, see Simulation.replication_runs)
+    intervals use the means of consecutive blocks of that many runs.
+    """
+    COMPONENTS = ("idle", "waiting", "overtime")
+
+    def __init__(self, labels: list[Any], components: list[np.ndarray], replication_runs: int = 1):
+        if len(labels) != len(components) or not labels:
+            raise ValueError("Need one (runs x 3) component array per label, and at least one candidate.")
+        self.labels = labels
+        self.components = [np.asarray(runs, dtype=np.float64) for runs in components]
+        self.means = np.array([runs.mean(axis=0) for runs in self.components])  # candidates x 3
+        self.runs = np.array([len(runs) for runs in self.components])
+        self.replication_runs = replication_runs
+
+    @classmethod
+    def from_simulations(cls, simulations: list[Simulation], labels: list[Any]) -> "CostIndex":
+        return cls(labels, [sim.run_cost_components() for sim in simulations], replication_runs=simulations[0].replication_runs)
+
+    def costs(self, cost_params: tuple[float, float, float]) -> np.ndarray:
+        """Mean total cost of every candidate under the given weights."""
+        return self.means @ np.asarray(cost_params, dtype=np.float64)
+
+    def optimum(self, cost_params: tuple[float, float, float], confidence: float = 0.95) -> dict[str, Any]:
+        """
+        Cheapest candidate under the given weights, with the confidence interval of its mean cost
+        (from the spread of its per-run costs).
+        """
+        weights = np.asarray(cost_params, dtype=np.float64)
+        costs = self.costs(weights)
+        best = int(np.argmin(costs))
+        run_costs = self.components[best] @ weights
+        if self.replication_runs > 1:
+            run_costs = replication_means(run_costs, self.replication_runs)
+        half_width = NormalDist().inv_cdf(0.5 + confidence / 2) * run_costs.std(ddof=1) / math.sqrt(len(run_costs)) \
+            if len(run_costs) > 1 else float('inf')
+        return {
+            "label": self.labels[best],
+            "index": best,
+            "cost": float(costs[best]),
+            "half_width": float(half_width),
+            "ci": (float(costs[best] - half_width), float(costs[best] + half_width)),
+            "runs": int(self.runs[best]),
+        }
+
+    def hull(self) -> list[Any]:
+        """
+        Labels of the candidates that are optimal for some non-negative weights (the lower convex
+        hull of the mean component vectors). Every other candidate is beaten for all weightings.
+
+        Candidate i is on the hull when some weights w >= 0 (summing to 1) satisfy
+        w . (x_j - x_i) >= 0 for every j; this is checked with one small linear program per candidate.
+        """
+        on_hull: list[Any] = []
+        count = len(self.labels)
+        for i in range(count):
+            others = np.delete(self.means, i, axis=0) - self.means[i]
+            if not len(others):
+                on_hull.append(self.labels[i])
+                continue
+            # maximise t subject to w . (x_j - x_i) >= t, sum(w) = 1, w >= 0; variables (w0, w1, w2, t)
+            result = linprog(
+                c=[0.0, 0.0, 0.0, -1.0],
+                A_ub=np.column_stack([-others, np.ones(len(others))]),
+                b_ub=np.zeros(len(others)),
+                A_eq=[[1.0, 1.0, 1.0, 0.0]],
+                b_eq=[1.0],
+                bounds=[(0, None)] * 3 + [(None, None)],
+            )
+            scale = max(1.0, float(np.abs(self.means).max()))
+            if result.status == 0 and -result.fun >= -1e-9 * scale:
+                on_hull.append(self.labels[i])
+        return on_hull
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Mean components and run count of every candidate."""
+        df = pd.DataFrame(self.means, columns=list(self.COMPONENTS))
+        df.insert(0, "label", self.labels)
+        df["runs"] = self.runs
+        return df
 
 class Optimisation:
-    def __init__(self, range: tuple[int, int]=(-5, 5), working_hours: float=8.0, mean_service_time: float=15.5, number_of_doctors: int=1, number_of_runs: int=10000, scheduled_arrival: float=15.0, cost_params: tuple[float, float, float]=(1.0, 0.2, 1.5), seed: int | None = None) -> None:
+    def __init__(self, range: tuple[int, int]=(-5, 5), working_hours: float=8.0, mean_service_time: float=15.5, number_of_doctors: int=1, number_of_runs: int=10000, scheduled_arrival: float=15.0, cost_params: tuple[float, float, float]=(1.0, 0.2, 1.5), seed: int | None = None, sampling: str = "per_run", cache_dir: str | None = None,
+                 checkpoint_dir: str | None = None, resume: bool = False, antithetic: bool = False) -> None:
         self.working_hours = working_hours  # hours
         self.mean_service_time = mean_service_time   # minutes
         self.number_of_doctors = number_of_doctors
@@ -15,53 +174,412 @@ class Optimisation:
         self.range = range
         self.cost_params = cost_params
         self.seed = seed
+        self.sampling = sampling  # see Simulation.SAMPLING_MODES
+        self.antithetic = antithetic  # pairs of runs from mirrored draws
+        # Every candidate uses the same seed: sample once and share the draws (common random numbers)
+        self.draws = DrawBank()
+        # rqmc and antithetic runs come in whole replications (see Simulation.replication_runs)
+        self.number_of_runs = self._configured().whole_replications(number_of_runs)
+        # Runs of seeded candidates persist across sessions here (see ResultCache)
+        self.cache = ResultCache(cache_dir) if cache_dir is not None else None
+        # Finished chunks of runs are written here as they complete; resume=True reads them back
+        if resume and checkpoint_dir is None:
+            raise ValueError("resume=True needs a checkpoint_dir to resume from.")
+        self.checkpoint = Checkpoint(checkpoint_dir, self._parameters(), resume) if checkpoint_dir is not None else None
         self.simulations: dict[str, list[Simulation]] = {
             "scheduled_arrival": [],
             "mean_service_time": [],
             "cost_params": [],
+            "grid": [],
+            "appointment_times": [],
         }
+        # runs given to each value by select_best(), per variable, and the values it had not dropped
+        self.allocations: dict[str, dict[float, int]] = {}
+        self.survivors: dict[str, list[float]] = {}
         self.summary: dict[str, list[Summary]] = {
             "scheduled_arrival": [],
             "mean_service_time": [],
             "cost_params": [],
+            "grid": [],
+            "appointment_times": [],
+        }
+        self.grid: SweepGrid | None = None  # result of the last optimise_grid() / optimise_2d()
+        self.slot_search: dict[str, Any] = {}  # outcome of the last optimise_slots()
+
+    GOLDEN_RATIO = (math.sqrt(5) - 1) / 2  # interval shrink factor of golden-section search
+
+    # Parameters a sweep can vary, as Optimisation attribute -> Simulation constructor argument
+    GRID_VARIABLES = {
+        "scheduled_arrival": "scheduled_arrival",
+        "mean_service_time": "mean_service_time",
+        "working_hours": "working_hours",
+        "number_of_doctors": "doctors",
+    }
+
+    def _configured(self, **values: float) -> Simulation:
+        """A set-up simulation with the base parameters, overridden by values (see GRID_VARIABLES)."""
+        params: dict[str, Any] = {
+            "working_hours": self.working_hours,
+            "scheduled_arrival": self.scheduled_arrival,
+            "mean_service_time": self.mean_service_time,
+            "doctors": self.number_of_doctors,
+        }
+        for variable, value in values.items():
+            if variable not in self.GRID_VARIABLES:
+                raise ValueError(f"Unknown variable '{variable}'. Choose from {list(self.GRID_VARIABLES)}.")
+            params[self.GRID_VARIABLES[variable]] = int(value) if variable == "number_of_doctors" else value
+
+        # Initialize a new simulation instance with base parameters
+        sim = Simulation(
+            **params,
+            iat_distr=TruncatedNormal(),
+            service_distr=Lognormal(desired_mean=params["mean_service_time"]),
+            cost_params=self.cost_params,
+            seed=self.seed,
+            sampling=self.sampling,
+            draws=self.draws,
+            antithetic=self.antithetic
+        )
+        sim.setup()
+        return sim
+
+    def _candidate(self, variable: str, offset: float) -> Simulation:
+        """A set-up simulation with the base parameters and `variable` shifted by offset."""
+        # Adjust the specified variable
+        if variable in ("scheduled_arrival", "mean_service_time"):
+            return self._configured(**{variable: getattr(self, variable) + offset})
+        if variable == "cost_params":
+            # Not applicable here
+            return self._configured()
+        raise ValueError(f"Unknown variable '{variable}' for optimisation.")
+
+    def _parameters(self) -> dict[str, Any]:
+        """Constructor parameters that decide the results (recorded with checkpoints)."""
+        return {
+            "range": self.range,
+            "working_hours": self.working_hours,
+            "mean_service_time": self.mean_service_time,
+            "number_of_doctors": self.number_of_doctors,
+            "number_of_runs": self.number_of_runs,
+            "scheduled_arrival": self.scheduled_arrival,
+            "cost_params": self.cost_params,
+            "seed": self.seed,
+            "sampling": self.sampling,
+            "antithetic": self.antithetic,
         }
 
-    def optimise_for(self, variable: str) -> None:
+    def _simulate(self, sim: Simulation, workers: int | None = None, number_of_runs: int | None = None,
+                  keep_schedules: bool = True) -> None:
+        """
+        Simulate number_of_runs (default self.number_of_runs) more runs of sim, read from the
+        result cache or the checkpoint when possible, and checkpointed chunk by chunk otherwise.
+        """
+        number_of_runs = self.number_of_runs if number_of_runs is None else number_of_runs
+        spawn = workers is not None
+        cache = self.cache if keep_schedules else None
+        if cache is not None and cache.load(sim, number_of_runs, spawn):
+            return
+        fresh = cache is not None and cache.cacheable(sim)
+        if self.checkpoint is None:
+            sim.simulate(number_of_runs=number_of_runs, workers=workers, keep_schedules=keep_schedules)
+        else:
+            self.checkpoint.simulate(sim, number_of_runs, workers, keep_schedules)
+        if fresh:
+            cache.save(sim, number_of_runs, spawn)
+
+    def _simulate_until(self, sim: Simulation, rel_half_width: float, workers: int | None = None) -> None:
+        """
+        sim.simulate_until(rel_half_width, max_runs=number_of_runs) through the result cache and the
+        checkpoint, like _simulate. Cached runs already meet the stopping rule, so simulate_until
+        then adds none and only works out precision_info from them.
+        """
+        spawn = workers is not None
+        # the batches checked, hence where the runs stop, depend on the number of workers
+        target = {"rel_half_width": rel_half_width, "max_runs": self.number_of_runs, "workers": workers}
+        loaded = self.cache is not None and self.cache.load(sim, None, spawn, target)
+        fresh = self.cache is not None and not loaded and self.cache.cacheable(sim)
+        sim.simulate_until(rel_half_width=rel_half_width, max_runs=self.number_of_runs, workers=workers,
+                           checkpoint=None if loaded else self.checkpoint)
+        if fresh:
+            self.cache.save(sim, None, spawn, target)
+
+    def _submit(self, pool: Executor, sim: Simulation,
+                keep_schedules: bool = True) -> list[tuple[int, int, Future[dict[str, np.ndarray]]]]:
+        """
+        Like _simulate on a shared pool: submit the chunks of sim's number_of_runs runs that are
+        neither cached nor checkpointed, as (first stream, streams, future). Finish with _collect().
+        """
+        if keep_schedules and self.cache is not None and self.cache.load(sim, self.number_of_runs, spawn=True):
+            return []
+        if self.checkpoint is None:
+            sim._start_runs(keep_schedules)
+            remaining = self.number_of_runs
+        else:
+            remaining = self.checkpoint.restore(sim, self.number_of_runs, True, keep_schedules)
+        start = sim.streams_used
+        chunks: list[tuple[int, int, Future[dict[str, np.ndarray]]]] = []
+        for streams, future in (sim._submit_runs(pool, remaining) if remaining > 0 else []):
+            chunks.append((start, streams, future))
+            start += streams
+        return chunks
+
+    def _collect(self, sim: Simulation, chunks: list[tuple[int, int, Future[dict[str, np.ndarray]]]],
+                 keep_schedules: bool = True) -> None:
+        """Add the chunks submitted by _submit() to sim in order, checkpointing each; cache the finished runs."""
+        for start, streams, future in chunks:
+            batch = future.result()
+            sim._add_batch(batch, keep_schedules)
+            if self.checkpoint is not None:
+                self.checkpoint.store(sim, start, streams, batch, spawn=True)
+        if chunks and keep_schedules and self.cache is not None:
+            self.cache.save(sim, self.number_of_runs, spawn=True)
+
+    def optimise_for(self, variable: str, workers: int | None = None, method: str = "grid", tolerance: float = 0.1,
+                     rel_half_width: float | None = None) -> None:
         """
         Optimize the simulation for a specific variable by adjusting its value
         within the defined range and observing the impact on key performance metrics.
+
+        method:
+        - "grid": simulate every integer offset in the range
+        - "golden": golden-section search over the continuous range until the bracket is
+          narrower than tolerance (see optimise_continuous); only for scheduled_arrival
+          and mean_service_time
+        - "select": ranking and selection over the integer offsets, spending runs in stages
+          on the candidates that are hard to tell apart (see select_best)
+
+        Serial runs of every grid point map the same banked standard normals (self.draws),
+        so random numbers are sampled once per sweep and cost differences between candidates
+        are not blurred by sampling noise. If workers is set, the runs of every grid point are
+        spread over one process pool instead, where each worker samples its own chunks
+        (see Simulation.simulate for how the random streams are assigned).
+
+        If rel_half_width is set, every grid point runs until its cost confidence interval is
+        that narrow relative to the cost (Simulation.simulate_until), with number_of_runs as the cap.
+        These runs go through the result cache and the checkpoint too (see _simulate_until).
         """
-        for value in tqdm(range(self.range[0], self.range[1] + 1), desc="Simulating progress: "):
-            # Initialize a new simulation instance with base parameters
-            sim = Simulation(
-                working_hours=self.working_hours,
-                scheduled_arrival=self.scheduled_arrival,
-                mean_service_time=self.mean_service_time,
-                doctors=self.number_of_doctors,
-                iat_distr=TruncatedNormal(),
-                service_distr=Lognormal(desired_mean=self.mean_service_time),
-                cost_params=self.cost_params,
-                seed=self.seed
-            )
-            # Adjust the specified variable
-            if variable == "scheduled_arrival":
-                sim.scheduled_arrival += value
-            elif variable == "mean_service_time":
-                sim.mean_service_time += value
-            elif variable == "cost_params":
-                # Not applicable here
-                pass
-            else:
-                raise ValueError(f"Unknown variable '{variable}' for optimisation.")
+        if method == "golden":
+            self.optimise_continuous(variable, tolerance=tolerance, workers=workers)
+            return
+        if method == "select":
+            self.select_best(variable)
+            return
+        if method != "grid":
+            raise ValueError(f"Unknown optimisation method '{method}'. Choose 'grid', 'golden' or 'select'.")
 
-            sim.setup()
-            # Run the simulation
-            if self.simulations[variable] and sim in self.simulations[variable]:
+        pending: list[Simulation] = []
+        for value in range(self.range[0], self.range[1] + 1):
+            sim = self._candidate(variable, value)
+            if (self.simulations[variable] and sim in self.simulations[variable]) or sim in pending:
                 # Skip existing simulation if already run
                 continue
-            sim.simulate(number_of_runs=self.number_of_runs)
-            self.simulations[variable].append(sim)
-            self.summary[variable].append(sim.summary())
+            pending.append(sim)
+
+        if rel_half_width is not None:
+            for sim in tqdm(pending, desc="Simulating progress: "):
+                self._simulate_until(sim, rel_half_width, workers)
+                self.simulations[variable].append(sim)
+                self.summary[variable].append(sim.summary())
+            return
+
+        if workers is None:
+            for sim in tqdm(pending, desc="Simulating progress: "):
+                self._simulate(sim)
+                self.simulations[variable].append(sim)
+                self.summary[variable].append(sim.summary())
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Submit every grid point up front so the pool stays busy across them
+            submitted = [self._submit(pool, sim) for sim in pending]
+            for sim, chunks in tqdm(zip(pending, submitted), total=len(pending), desc="Simulating progress: "):
+                self._collect(sim, chunks)
+                self.simulations[variable].append(sim)
+                self.summary[variable].append(sim.summary())
+
+    def optimise_continuous(self, variable: str = "scheduled_arrival", tolerance: float = 0.1,
+                            bounds: tuple[float, float] | None = None, workers: int | None = None) -> Simulation:
+        """
+        Minimise the total cost over a continuous value of `variable` with golden-section search.
+
+        Every candidate uses the same seed and the shared draw bank, so the cost curve is a
+        single sample path (common random numbers) and comparisons between nearby values are
+        not drowned in sampling noise. Each step shrinks the bracket by GOLDEN_RATIO and costs
+        one simulation, so about log(width / tolerance) / log(1 / GOLDEN_RATIO) + 2 simulations
+        are needed (12 for the default range and tolerance) instead of width / tolerance grid points.
+
+        Evaluated candidates are recorded in self.simulations / self.summary like optimise_for
+        (kept sorted by value), so optimal_solution, sensitivity_analysis and the visualisations
+        work unchanged.
+
+        Parameters:
+        - bounds: (low, high) values to search; defaults to the base value plus self.range
+        - workers: spread the runs of each candidate over a process pool of this size
+
+        Returns the simulation with the lowest cost.
+        """
+        if variable not in ("scheduled_arrival", "mean_service_time"):
+            raise ValueError(f"Continuous optimisation is not available for '{variable}'.")
+        base = getattr(self, variable)
+        low, high = bounds if bounds is not None else (base + self.range[0], base + self.range[1])
+        if not low < high:
+            raise ValueError(f"Invalid bounds ({low}, {high}) for optimisation.")
+
+        evaluated: dict[float, Simulation] = {}
+
+        def cost(value: float) -> float:
+            if value not in evaluated:
+                sim = self._evaluate(variable, value - base, workers)
+                evaluated[value] = sim
+            return evaluated[value].total_cost()
+
+        progress = tqdm(desc="Golden-section search: ")
+        left = high - self.GOLDEN_RATIO * (high - low)
+        right = low + self.GOLDEN_RATIO * (high - low)
+        left_cost, right_cost = cost(left), cost(right)
+        progress.update(2)
+        while high - low > tolerance:
+            if left_cost < right_cost:
+                # Minimum lies in [low, right]
+                high, right, right_cost = right, left, left_cost
+                left = high - self.GOLDEN_RATIO * (high - low)
+                left_cost = cost(left)
+            else:
+                # Minimum lies in [left, high]
+                low, left, left_cost = left, right, right_cost
+                right = low + self.GOLDEN_RATIO * (high - low)
+                right_cost = cost(right)
+            progress.update(1)
+        progress.close()
+
+        return min(evaluated.values(), key=lambda sim: sim.total_cost())
+
+    def _evaluate(self, variable: str, offset: float, workers: int | None = None) -> Simulation:
+        """Simulate one candidate (or reuse an identical recorded one), keeping records sorted by value."""
+        sim = self._candidate(variable, offset)
+        simulations = self.simulations[variable]
+        if sim in simulations:
+            return simulations[simulations.index(sim)]
+
+        self._simulate(sim, workers)
+        summary = sim.summary()
+        position = sum(1 for other in simulations if getattr(other, variable) < getattr(sim, variable))
+        simulations.insert(position, sim)
+        self.summary[variable].insert(position, summary)
+        return sim
+
+    def select_best(self, variable: str, initial_runs: int = 500, stage_runs: int = 2000,
+                    confidence: float = 0.95, max_runs: int | None = None) -> Simulation:
+        """
+        Ranking and selection over the grid of optimise_for: spend runs in stages where they
+        help tell the best candidates apart, instead of number_of_runs on every candidate.
+
+        Every candidate first gets initial_runs. Because all candidates share the same random
+        streams (common random numbers), run i of two candidates is a matched pair, and each
+        candidate is compared with the current best through the paired cost differences.
+        After each stage:
+        - candidates whose difference to the best is positive with the given confidence are dropped
+        - selection stops once the Bonferroni bound on the probability of correct selection,
+          1 - sum_i P(candidate i beats the best), reaches confidence, or every survivor has max_runs
+        - otherwise the next stage_runs are split over the survivors in the OCBA way,
+          proportional to (std of difference / mean difference)^2 for the competitors and
+          std_b * sqrt(sum_i n_i^2 / std_i^2) for the best (std of a candidate's own cost)
+        The best takes part in every comparison, so it is topped up to at least the runs of every
+        survivor: each run of a competitor is paired with a run of the best and none is wasted.
+
+        Parameters:
+        - max_runs: cap on the runs of a single candidate; defaults to number_of_runs
+        With antithetic or rqmc sampling initial_runs and max_runs are rounded up to whole replications
+        (initial_runs to at least two, so that every paired difference has a variance).
+
+        Candidates are recorded in self.simulations / self.summary like optimise_for, and the
+        final number of runs per value is stored in self.allocations[variable] and printed,
+        the values not dropped in self.survivors[variable].
+
+        Returns the selected simulation.
+        """
+        max_runs = self.number_of_runs if max_runs is None else max_runs
+        z = NormalDist().inv_cdf(confidence)
+        candidates: list[Simulation] = []
+        for value in range(self.range[0], self.range[1] + 1):
+            sim = self._candidate(variable, value)
+            if sim not in candidates:
+                candidates.append(sim)
+        # Whole replications with antithetic or rqmc sampling, and at least two to have a variance
+        block = candidates[0].replication_runs
+        max_runs = candidates[0].whole_replications(max_runs)
+        initial_runs = min(max(candidates[0].whole_replications(initial_runs), 2 * block), max_runs)
+        for sim in tqdm(candidates, desc="Initial stage: "):
+            self._simulate(sim, number_of_runs=initial_runs)
+
+        survivors = list(range(len(candidates)))
+        stages = 0
+        while True:
+            costs = [candidates[i].run_costs() for i in range(len(candidates))]
+            best = min(survivors, key=lambda i: costs[i].mean())
+            most = max(len(costs[i]) for i in survivors)
+            if len(costs[best]) < most:
+                # A new best with fewer runs than a competitor: pair every competitor run first
+                self._simulate(candidates[best], number_of_runs=most - len(costs[best]))
+                continue
+            gaps: dict[int, tuple[float, float]] = {}  # candidate -> (mean difference, std of difference)
+            errors: dict[int, float] = {}  # candidate -> standard error of the mean difference
+            for i in survivors:
+                if i == best:
+                    continue
+                pairs = len(costs[i])  # the best has at least as many runs
+                # with antithetic or rqmc sampling a block of runs is one replication
+                difference = candidates[i].replications(costs[i] - costs[best][:pairs])
+                gaps[i] = (float(difference.mean()), float(difference.std(ddof=1)))
+                errors[i] = gaps[i][1] / math.sqrt(len(difference))
+
+            # Drop candidates that are worse than the best with the requested confidence
+            dropped = [i for i, (gap, _) in gaps.items() if gap - z * errors[i] > 0]
+            survivors = [i for i in survivors if i not in dropped]
+            for i in dropped:
+                del gaps[i]
+
+            error_bound = sum(NormalDist().cdf(-gap / errors[i]) if errors[i] > 0 else float(gap <= 0)
+                              for i, (gap, _) in gaps.items())
+            runs = {i: len(candidates[i].schedules) for i in survivors}
+            if len(survivors) == 1 or 1 - error_bound >= confidence or all(n >= max_runs for n in runs.values()):
+                break
+
+            # OCBA: more runs where the difference is small relative to its noise
+            weights = {i: (std / max(abs(gap), 1e-9)) ** 2 for i, (gap, std) in gaps.items()}
+            spreads = {i: float(candidates[i].replications(costs[i]).std(ddof=1)) for i in survivors}
+            weights[best] = spreads[best] * math.sqrt(sum((weight / max(spreads[i], 1e-9)) ** 2
+                                                          for i, weight in weights.items()))
+            total = sum(weights.values())
+            targets: dict[int, int] = {}
+            for i in survivors:
+                extra = math.ceil(stage_runs * weights[i] / total)
+                extra = -(-extra // block) * block  # whole replications
+                targets[i] = min(runs[i] + extra, max_runs)
+            # The best never has fewer runs than a competitor, so every competitor run has a partner
+            targets[best] = max(targets.values())
+            stages += 1
+            for i in survivors:
+                if targets[i] > runs[i]:
+                    self._simulate(candidates[i], number_of_runs=targets[i] - runs[i])
+
+        for sim in candidates:
+            if sim not in self.simulations[variable]:
+                self.simulations[variable].append(sim)
+                self.summary[variable].append(sim.summary())
+        order = sorted(range(len(self.simulations[variable])), key=lambda i: getattr(self.simulations[variable][i], variable))
+        self.simulations[variable] = [self.simulations[variable][i] for i in order]
+        self.summary[variable] = [self.summary[variable][i] for i in order]
+
+        self.allocations[variable] = {getattr(sim, variable): len(sim.schedules) for sim in candidates}
+        self.survivors[variable] = [getattr(candidates[i], variable) for i in survivors]
+        total_runs = sum(self.allocations[variable].values())
+        print(f"\nRanking and selection for {variable}: {stages} extra stage(s), {total_runs} runs in total "
+              f"({len(candidates) * self.number_of_runs} for the full grid)")
+        for value, runs in self.allocations[variable].items():
+            marker = " <- selected" if value == getattr(candidates[best], variable) else ""
+            print(f"  {variable} = {value}: {runs} runs{marker}")
+        return candidates[best]
 
     def optimal_value(self, variable: str) -> tuple[Any, float]:
         """
@@ -114,78 +632,143 @@ class Optimisation:
 
         return optimal_simulation
 
-    def _optimise_2d(self, fixed_var: str, var_to_opt: str, fixed_var_range: tuple[int, int]) -> None:
+    def optimise_slots(self, runs: int = 5000, initial: np.ndarray | list[float] | None = None,
+                       max_iterations: int = 200) -> Simulation:
+        """
+        Tune every appointment time at once (uneven slot spacing) to minimise the total cost.
+
+        Draws `runs` replications once (the first runs of every candidate, as in the draw bank)
+        and minimises their mean cost with L-BFGS-B, using the pathwise gradient of
+        Simulation.slot_costs: each step evaluates the whole candidate vector over all runs in
+        one vectorized pass. The search moves the gaps between consecutive appointments
+        (kept >= 0), so appointments stay in order and start at 0 or later. It starts from
+        initial, by default the evenly spaced base schedule.
+
+        The best vector is then simulated with number_of_runs runs like any other candidate and
+        recorded under self.simulations["appointment_times"]; the search itself (sample costs
+        before and after, iterations) is kept in self.slot_search.
+        """
+        sim = self._configured()
+        if initial is not None:
+            sim.appointment_times = np.asarray(initial, dtype=np.float64)
+            sim.setup()
+        start = sim.appointment_slots()
+        service_times, interarrival_deviation = sim._draw(sim._streams(sim.whole_replications(runs), spawn=False))
+
+        def objective(gaps: np.ndarray) -> tuple[float, np.ndarray]:
+            costs, gradient = sim.slot_costs(np.cumsum(gaps), service_times, interarrival_deviation)
+            # appointment j is the sum of gaps 0..j, so gap k moves every appointment from k on
+            return float(costs.mean()), np.cumsum(gradient[::-1])[::-1]
+
+        gaps = np.diff(start, prepend=0.0)
+        result = minimize(objective, gaps, jac=True, method="L-BFGS-B",
+                          bounds=[(0.0, None)] * len(gaps), options={"maxiter": max_iterations})
+
+        best = self._configured()
+        best.appointment_times = np.cumsum(result.x)
+        best.setup()
+        self._simulate(best)
+        self.simulations["appointment_times"].append(best)
+        self.summary["appointment_times"].append(best.summary())
+        self.slot_search = {
+            "appointment_times": best.appointment_times,
+            "initial_sample_cost": objective(gaps)[0],
+            "sample_cost": float(result.fun),
+            "runs": runs,
+            "iterations": result.nit,
+            "evaluations": result.nfev,
+            "converged": bool(result.success),
+        }
+        return best
+
+    def optimise_grid(self, axes: dict[str, list[float]], workers: int | None = None,
+                      keep_schedules: bool = True) -> SweepGrid:
+        """
+        Simulate every combination of the given values (an N-D sweep) and return the costs as a grid.
+
+        Parameters:
+        - axes: variable -> values to try, for any of scheduled_arrival, mean_service_time,
+          working_hours and number_of_doctors (e.g. {"number_of_doctors": [1, 2, 3],
+          "scheduled_arrival": [4, 6, 8, 10]}); other parameters keep their base values
+        - workers: run the cells in parallel on one process pool of this size
+        - keep_schedules: if False, cells keep streamed summaries instead of their runs
+          (see Simulation.simulate), which keeps memory flat for large grids
+
+        Serial cells share the draw bank (self.draws): every cell with the same number of patients
+        maps the same standard normals, so cost differences across the surface come from the
+        parameters and not from sampling noise. Cells are also recorded under self.simulations["grid"].
+        """
+        for variable in axes:
+            if variable not in self.GRID_VARIABLES:
+                raise ValueError(f"Unknown variable '{variable}'. Choose from {list(self.GRID_VARIABLES)}.")
+        variables = list(axes)
+        values = [list(axes[variable]) for variable in variables]
+        grid = SweepGrid(variables, values)
+
+        cells: list[tuple[tuple[int, ...], Simulation]] = []
+        for index in itertools.product(*(range(len(axis)) for axis in values)):
+            sim = self._configured(**{variable: values[axis][i] for axis, (variable, i) in enumerate(zip(variables, index))})
+            cells.append((index, sim))
+
+        if workers is None:
+            for index, sim in tqdm(cells, desc="Simulating grid: "):
+                self._simulate(sim, keep_schedules=keep_schedules)
+                grid.add(index, sim, sim.summary())
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Submit every cell up front so the pool stays busy across them
+                submitted = [self._submit(pool, sim, keep_schedules) for _, sim in cells]
+                for (index, sim), chunks in tqdm(zip(cells, submitted), total=len(cells), desc="Simulating grid: "):
+                    self._collect(sim, chunks, keep_schedules)
+                    grid.add(index, sim, sim.summary())
+
+        for _, sim in cells:
+            self.simulations["grid"].append(sim)
+            self.summary["grid"].append(sim.summaries)
+        self.grid = grid
+        return grid
+
+    def optimise_2d(self, fixed_var: str, var_to_opt: str, fixed_var_range: tuple[int, int],
+                    workers: int | None = None) -> SweepGrid:
         """
         Perform a 2D optimisation by fixing one variable and optimising another
         across a specified range.
 
-        DISCONTINUED.
+        fixed_var takes the base value plus every integer offset in fixed_var_range, var_to_opt the
+        base value plus every offset in self.range; both axes are swept at once with optimise_grid().
+        self.results_2d holds the optimum of var_to_opt for every fixed value, in the form
+        ClinicVisualization.plot_2d_relationship takes.
         """
-        # Make sure variables are valid
-        if fixed_var not in ["scheduled_arrival", "mean_service_time", "working_hours"]:
-            raise ValueError(f"Unknown fixed variable '{fixed_var}' for 2D optimisation.")
-        if var_to_opt not in ["scheduled_arrival", "mean_service_time", "working_hours"]:
-            raise ValueError(f"Unknown variable to optimise '{var_to_opt}' for 2D optimisation.")
         if fixed_var == var_to_opt:
             raise ValueError("Fixed variable and variable to optimise must be different.")
+        axes: dict[str, list[float]] = {}
+        for variable, offsets in ((fixed_var, fixed_var_range), (var_to_opt, self.range)):
+            if variable not in self.GRID_VARIABLES:
+                raise ValueError(f"Unknown variable '{variable}' for 2D optimisation.")
+            axes[variable] = [getattr(self, variable) + offset for offset in range(offsets[0], offsets[1] + 1)]
 
-        fixed_vars: list[float] = []
-        opt_vars: list[float] = []
-        opt_costs: list[float] = []
-        for fixed_value in range(fixed_var_range[0], fixed_var_range[1] + 1):
-            # Create a new optimisation instance with the fixed variable set
-            if fixed_var == "scheduled_arrival":
-                opt = Optimisation(
-                    range=self.range,
-                    working_hours=self.working_hours,
-                    mean_service_time=self.mean_service_time,
-                    number_of_doctors=self.number_of_doctors,
-                    number_of_runs=self.number_of_runs,
-                    scheduled_arrival=self.scheduled_arrival + fixed_value,
-                    cost_params=self.cost_params,
-                    seed=self.seed
-                )
-            elif fixed_var == "mean_service_time":
-                opt = Optimisation(
-                    range=self.range,
-                    working_hours=self.working_hours,
-                    mean_service_time=self.mean_service_time + fixed_value,
-                    number_of_doctors=self.number_of_doctors,
-                    number_of_runs=self.number_of_runs,
-                    scheduled_arrival=self.scheduled_arrival,
-                    cost_params=self.cost_params,
-                    seed=self.seed
-                )
-            elif fixed_var == "working_hours":
-                opt = Optimisation(
-                    range=self.range,
-                    working_hours=self.working_hours + fixed_value,
-                    mean_service_time=self.mean_service_time,
-                    number_of_doctors=self.number_of_doctors,
-                    number_of_runs=self.number_of_runs,
-                    scheduled_arrival=self.scheduled_arrival,
-                    cost_params=self.cost_params,
-                    seed=self.seed
-                )
-            else:
-                raise ValueError(f"Unknown fixed variable '{fixed_var}' for 2D optimisation.")
-
-            # Optimise the other variable
-            print(f"Performing 2D optimisation for {var_to_opt} with {fixed_var} = {getattr(opt, fixed_var)}.")
-            opt.optimise_for(variable=var_to_opt)
-            optimal_value, optimal_cost = opt.optimal_value(variable=var_to_opt)
-            fixed_vars.append(getattr(opt, fixed_var))
-            opt_vars.append(optimal_value)
-            opt_costs.append(optimal_cost)
-            # Store results
-            self.simulations["2d"].extend(opt.simulations[var_to_opt])
-            self.summary["2d"].extend(opt.summary[var_to_opt])
-        
-        self.results_2d = {
-            "fixed_vars": fixed_vars,
-            "opt_vars": opt_vars,
-            "opt_costs": opt_costs
-        }
+        grid = self.optimise_grid(axes, workers=workers)
+        self.results_2d = grid.optimum_along(var_to_opt)
+        return grid
+
+    def cost_index(self, variable: str = "scheduled_arrival") -> CostIndex:
+        """
+        Index of the cost components of every simulation recorded for `variable` (or "grid"),
+        labelled by the variable's value (a tuple of the grid values for "grid").
+        Query it for any cost weights without re-simulating, e.g.
+        model.cost_index("scheduled_arrival").optimum((1.0, 0.5, 1.5)).
+        """
+        simulations = self.simulations.get(variable)
+        if not simulations:
+            raise RuntimeError(f"No simulations found for variable '{variable}'. Run optimise_for() first.")
+        if variable == "grid":
+            names = [self.GRID_VARIABLES[name] for name in self.grid.variables] if self.grid is not None else []
+            labels = [tuple(getattr(sim, name) for name in names) for sim in simulations]
+        elif variable == "cost_params":
+            labels = [str(sim) for sim in simulations]
+        else:
+            labels = [getattr(sim, variable) for sim in simulations]
+        return CostIndex.from_simulations(simulations, labels)
 
     def save_summary_to_db(self, db_path: str, print_summary: bool = True) -> None:
         # Before saving, list all summaries and their respective file sizes
@@ -275,15 +858,43 @@ class Optimisation:
                 print(f"  Patients waiting > 15 min:    {s['patient_metrics']['patients_waiting_over_15min']:>12}")
                 print(f"  Percentage waiting > 15 min:  {s['patient_metrics']['percentage_waiting_over_15min']:>12.2f}%")
 
-                # Run comprehensive control variate comparison (this will take some time)
-                # Using same number of runs and seeds as optimization for perfect consistency
+                # Comprehensive control variate comparison on the runs of the optimisation
                 print(f"\n  Running comprehensive control variate comparison with {self.number_of_runs} runs...")
-                sim.comprehensive_control_variate_comparison(num_runs=self.number_of_runs, base_seed=sim.seed)
+                self._control_variate_comparison(sim)
 
         print("\n" + "="*80)
         print("END OF SUMMARY")
         print("="*80 + "\n")
 
+    def _control_variate_comparison(self, sim: Simulation) -> dict[str, Any]:
+        """
+        sim.comprehensive_control_variate_comparison and regression_control_variate_comparison over
+        number_of_runs. They read the stored runs; only a sim without them simulates again, and that
+        result is reused from the checkpoint if done before. Skipped for rqmc sampling, whose few
+        randomizations are too few replications for a pilot stage.
+        """
+        if sim.sampling == "rqmc":
+            print("  Skipped: rqmc runs are not i.i.d.; their error bars come from the randomizations.")
+            return {}
+
+        def compare() -> None:
+            sim.comprehensive_control_variate_comparison(num_runs=self.number_of_runs)
+            sim.regression_control_variate_comparison(num_runs=self.number_of_runs)
+
+        if self.checkpoint is None or sim.seed is None or len(sim.schedules) >= self.number_of_runs:
+            compare()
+            return sim.control_variate_info["comprehensive"]
+        name = self.checkpoint.result_name(sim, "cv", num_runs=self.number_of_runs)
+        info = self.checkpoint.load_result(name)
+        if info is None:
+            compare()
+            self.checkpoint.store_result(name, sim.control_variate_info)
+        else:
+            sim.control_variate_info = info
+            sim._print_cv_comparison_results(info["comprehensive"])
+            sim._print_regression_cv_results(info["regression"])
+        return sim.control_variate_info["comprehensive"]
+
     def sensitivity_analysis(self, variable: str, optimal_solution: Simulation) -> list[dict[str, Any]]:
         """
         Perform sensitivity analysis on the specified variable by examining how changes
@@ -311,7 +922,10 @@ class Optimisation:
                     iat_distr=optimal_solution.iat_distribution,
                     service_distr=optimal_solution.service_distribution,
                     cost_params=optimal_solution.cost_params,
-                    seed=self.seed
+                    seed=self.seed,
+                    sampling=optimal_solution.sampling,
+                    draws=self.draws,
+                    antithetic=optimal_solution.antithetic
                 )
                 # Adjust the variable
                 sim[variable] = adjusted_value
@@ -330,7 +944,7 @@ class Optimisation:
                     })
                     continue
 
-                sim.simulate(number_of_runs=self.number_of_runs)
+                self._simulate(sim)
                 summary = sim.summary()
                 analysis_results.append({
                     "id": delta + 4, # starts from 1
@@ -395,6 +1009,20 @@ class Optimisation:
 
         if variable in ["scheduled_arrival", "mean_service_time"]:
             text = variable.replace("_", " ").title()
+            optimal = analysis_results[3]["simulation"]
+            if optimal.accumulator is None:
+                # Slopes from the sample-path derivatives of the optimal runs (no extra simulation)
+                print(f"\n--- Local Slopes at Optimal {text} (per minute, 95% CI) ---")
+                gradient = optimal.cost_gradient()[variable]
+                print(pd.DataFrame([
+                    {
+                        "metric": metric,
+                        "slope": slope["slope"],
+                        "ci_low": slope["slope"] - slope["half_width"],
+                        "ci_high": slope["slope"] + slope["half_width"],
+                    }
+                    for metric, slope in gradient.items()
+                ]).to_string(index=False))
             # Split into three sections: below optimal, at optimal, above optimal
             for i in range(3):
                 if i == 0:
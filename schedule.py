@@ -1,32 +1,308 @@
 import heapq
 import bisect
-from markov import MarkovChain
+from markov import MarkovChain, MarkovChainBatch
 import pandas as pd
 import numpy as np
+from typing import Iterator
 
-def two_largest(values: list[float]) -> tuple[float | None, float | None]:
-    if not values:
-        return None, None
-    if len(values) == 1:
-        return values[0], None
-    max1 = float("-inf")
-    max2 = float("-inf")
-    for v in values:
-        if v > max1:
-            max2 = max1
-            max1 = v
-        elif v > max2:
-            max2 = v
-    return (max1, max2 if max2 != float("-inf") else None)
+def appointment_slots(patients: int, scheduled_arrival: float, appointment_times: np.ndarray | None=None) -> np.ndarray:
+    """Booked time of every patient: appointment_times if given, else evenly spaced i * scheduled_arrival."""
+    if appointment_times is None:
+        return np.arange(patients) * scheduled_arrival
+    return np.asarray(appointment_times, dtype=np.float64)[:patients]
+
+def lindley_batch(arrival_times: np.ndarray, service_times: np.ndarray,
+                  tangents: tuple[np.ndarray, np.ndarray] | None=None, predecessors: bool=False) -> dict[str, np.ndarray]:
+    """Single-server schedules for many runs at once.
+
+    Both inputs are (runs x patients) matrices with arrivals already clipped at 0
+    and sorted along each row. The Lindley recursion
+        start[i] = max(arrival[i], end[i-1]),  end[i] = start[i] + service[i]
+    is stepped over the patient axis, so every run advances together as one column.
+    Uses the same floating point operations as Schedule.setup_schedule, so the
+    results are identical to the per-run path.
+
+    If tangents is given as (arrival_tangents, service_tangents), both (directions x runs x patients)
+    derivatives of the inputs with respect to some parameters, the sample-path (IPA) derivatives
+    of the start times are carried along: a patient who opens a busy period starts when they
+    arrive, anybody else when the previous patient ends. They are returned as start_tangents
+    (directions x runs x patients) and free_tangents (directions x runs x servers).
+
+    If predecessors is set, the busy-period structure itself is returned for reverse-mode
+    gradients: predecessors[r, i] is the patient whose end patient i waited for (-1 if they
+    started on arrival) and last_patients[r, k] the last patient of doctor k (-1 if unused).
+
+    Returns the same keys as multi_server_batch (with one doctor).
+    """
+    runs, patients = arrival_times.shape
+    start = np.empty((runs, patients))
+    end = np.empty((runs, patients))
+    idle = np.zeros(runs)
+    queue_area = np.zeros(runs)
+    prev_end = np.zeros(runs)
+    if tangents is not None:
+        arrival_tangents, service_tangents = tangents
+        start_tangents = np.empty(arrival_tangents.shape)
+        prev_end_tangent = np.zeros(arrival_tangents.shape[:2])
+    for i in range(patients):
+        arrival = arrival_times[:, i]
+        if tangents is not None:
+            start_tangents[:, :, i] = np.where(arrival >= prev_end, arrival_tangents[:, :, i], prev_end_tangent)
+            prev_end_tangent = start_tangents[:, :, i] + service_tangents[:, :, i]
+        start[:, i] = np.maximum(arrival, prev_end)
+        # Server was free -> idle from the previous end until this arrival (0 otherwise)
+        idle += start[:, i] - prev_end
+        prev_end = start[:, i] + service_times[:, i]
+        end[:, i] = prev_end
+        queue_area += prev_end - arrival
+    result = {
+        "service_start_times": start,
+        "service_end_times": end,
+        "doctor_idle_times": idle[:, None],
+        "doctor_free_times": prev_end[:, None],
+        # With one doctor the system is empty exactly when the doctor is idle
+        "empty_times": idle.copy(),
+        "queue_areas": queue_area,
+    }
+    if tangents is not None:
+        result["start_tangents"] = start_tangents
+        result["free_tangents"] = prev_end_tangent[:, :, None]
+    if predecessors:
+        # Whoever started after arriving waited for the patient before
+        result["predecessors"] = np.where(start > arrival_times, np.arange(patients) - 1, -1)
+        result["last_patients"] = np.full((runs, 1), patients - 1, dtype=np.int64)
+    return result
+
+def multi_server_batch(arrival_times: np.ndarray, service_times: np.ndarray, servers: int=1,
+                       queue_capacity: float=float('inf'),
+                       tangents: tuple[np.ndarray, np.ndarray] | None=None, predecessors: bool=False) -> dict[str, np.ndarray]:
+    """Multi-server schedules for many runs at once.
+
+    Keeps a (runs x servers) array of the time each doctor becomes free. The i-th patient
+    of every run is assigned in one step to that run's earliest-free doctor (lowest index
+    on ties, like the heap in Schedule.setup_schedule), so start and end times match the
+    per-run path exactly. Arrivals must be clipped at 0 and sorted along each row.
+
+    With a finite queue_capacity, patients arriving to a full system are dropped and get
+    NaN start and end times.
+
+    The same sweep also accumulates the event-timeline metrics that MarkovChain derives:
+    the time the system is empty and the area under the number-in-system curve.
+
+    tangents carries IPA derivatives along as in lindley_batch, through each doctor's busy
+    periods (a patient who waited starts when their doctor's previous patient ends).
+    Dropped patients get NaN start tangents; who is dropped does not change under small
+    perturbations, so drops add nothing to the derivatives.
+
+    Returns a dict of:
+        service_start_times, service_end_times: (runs x patients)
+        doctor_idle_times: (runs x servers) idle time of each doctor up to their last patient
+        doctor_free_times: (runs x servers) when each doctor finished their last patient (0 if unused)
+        empty_times: (runs) time with nobody in the system, up to the last departure
+        queue_areas: (runs) integral of the number of patients in the system over time
+        start_tangents, free_tangents: only with tangents, see lindley_batch
+        predecessors, last_patients: only with predecessors, see lindley_batch
+    """
+    runs, patients = arrival_times.shape
+    rows = np.arange(runs)
+    if tangents is not None:
+        arrival_tangents, service_tangents = tangents
+        start_tangents = np.full(arrival_tangents.shape, np.nan)
+        free_tangents = np.zeros(arrival_tangents.shape[:2] + (servers,))
+    if predecessors:
+        predecessor = np.full((runs, patients), -1, dtype=np.int64)
+        last_patient = np.full((runs, servers), -1, dtype=np.int64)
+    start = np.full((runs, patients), np.nan)
+    end = np.full((runs, patients), np.nan)
+    free_at = np.zeros((runs, servers))
+    doctor_idle = np.zeros((runs, servers))
+    empty = np.zeros(runs)
+    queue_area = np.zeros(runs)
+    last_departure = np.zeros(runs)
+    for i in range(patients):
+        arrival = arrival_times[:, i]
+        # Arrivals are sorted, so the system was empty since the latest departure so far
+        empty += np.maximum(0.0, arrival - last_departure)
+        doctor = free_at.argmin(axis=1)
+        free_time = free_at[rows, doctor]
+        start_i = np.maximum(arrival, free_time)
+        end_i = start_i + service_times[:, i]
+        if tangents is not None:
+            start_tangent = np.where(arrival >= free_time, arrival_tangents[:, :, i], free_tangents[:, rows, doctor])
+        if predecessors:
+            waited_for = np.where(arrival >= free_time, -1, last_patient[rows, doctor])
+        if queue_capacity == float('inf'):
+            served = rows
+        else:
+            # busy doctors plus patients still waiting (NaN starts of dropped patients never count)
+            busy = (free_at > arrival[:, None]).sum(axis=1)
+            waiting = (start[:, :i] > arrival[:, None]).sum(axis=1)
+            served = rows[busy + waiting < servers + queue_capacity]
+            doctor, free_time = doctor[served], free_time[served]
+            start_i, end_i = start_i[served], end_i[served]
+            if tangents is not None:
+                start_tangent = start_tangent[:, served]
+            if predecessors:
+                waited_for = waited_for[served]
+        doctor_idle[served, doctor] += start_i - free_time
+        free_at[served, doctor] = end_i
+        start[served, i] = start_i
+        end[served, i] = end_i
+        last_departure[served] = np.maximum(last_departure[served], end_i)
+        queue_area[served] += end_i - arrival[served]
+        if tangents is not None:
+            start_tangents[:, served, i] = start_tangent
+            free_tangents[:, served, doctor] = start_tangent + service_tangents[:, served, i]
+        if predecessors:
+            predecessor[served, i] = waited_for
+            last_patient[served, doctor] = i
+    result = {
+        "service_start_times": start,
+        "service_end_times": end,
+        "doctor_idle_times": doctor_idle,
+        "doctor_free_times": free_at,
+        "empty_times": empty,
+        "queue_areas": queue_area,
+    }
+    if tangents is not None:
+        result["start_tangents"] = start_tangents
+        result["free_tangents"] = free_tangents
+    if predecessors:
+        result["predecessors"] = predecessor
+        result["last_patients"] = last_patient
+    return result
+
+class PrefixSchedule:
+    """
+    Multi-server schedules of many runs, as multi_server_batch, that keep the state after every
+    patient: each doctor's free time and idle time so far, the time the system was empty, the
+    area under the number-in-system curve and the latest departure. Changing the arrivals from
+    patient k on then only re-runs patients k onwards (see reevaluate_from).
+
+    Everything is stored patient-major, (patients [+ 1]) x runs [x servers], so that the sweep
+    reads contiguous rows; result() returns the usual (runs x ...) arrays.
+    """
+    def __init__(self, arrival_times: np.ndarray, service_times: np.ndarray, servers: int=1,
+                 queue_capacity: float=float('inf')):
+        self.arrival_times = np.array(np.asarray(arrival_times, dtype=np.float64).T)
+        self.service_times = np.array(np.asarray(service_times, dtype=np.float64).T)
+        self.servers = servers
+        self.queue_capacity = queue_capacity
+        patients, runs = self.arrival_times.shape
+        self.start = np.full((patients, runs), np.nan)
+        self.end = np.full((patients, runs), np.nan)
+        # state before patient i (row patients: after the last one)
+        self.free_at = np.zeros((patients + 1, runs, servers))
+        self.doctor_idle = np.zeros((patients + 1, runs, servers))
+        self.empty = np.zeros((patients + 1, runs))
+        self.queue_area = np.zeros((patients + 1, runs))
+        self.last_departure = np.zeros((patients + 1, runs))
+        self.patients_swept = 0  # patient steps computed over all runs, to see what reevaluation saves
+        self._sweep(np.zeros(runs, dtype=np.int64), None)
+
+    def result(self) -> dict[str, np.ndarray]:
+        """The keys of multi_server_batch, as (runs x ...) views that the next reevaluate_from() updates."""
+        return {
+            "service_start_times": self.start.T,
+            "service_end_times": self.end.T,
+            "doctor_idle_times": self.doctor_idle[-1],
+            "doctor_free_times": self.free_at[-1],
+            "empty_times": self.empty[-1],
+            "queue_areas": self.queue_area[-1],
+        }
+
+    def reevaluate_from(self, k: int, new_arrivals: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Replace the arrivals of patients k onwards by new_arrivals (runs x (patients - k), rows
+        still sorted after the unchanged prefix) and bring the schedules up to date; returns result().
+
+        Nothing before patient k is recomputed: each run restarts from the stored state before its
+        first changed arrival. With an unlimited queue a run also stops once its state after a
+        patient matches the old one and no later arrival changed (typically when the busy period
+        around the change has ended); its later totals are then shifted by the difference so far,
+        so they agree with a full sweep up to rounding. With a finite queue, admissions depend on
+        who is still waiting, so runs sweep to the end.
+        """
+        patients = self.arrival_times.shape[0]
+        new_arrivals = np.asarray(new_arrivals, dtype=np.float64).T
+        if not 0 <= k <= patients or new_arrivals.shape != (patients - k, self.arrival_times.shape[1]):
+            raise ValueError(f"Expected arrivals of patients {k} to {patients - 1} for every run.")
+        previous = self.arrival_times[k - 1:k] if k else np.zeros((0, new_arrivals.shape[1]))
+        if np.any(np.diff(np.concatenate([previous, new_arrivals]), axis=0) < 0):
+            raise ValueError("Arrival times must stay sorted within every run.")
+
+        changed = new_arrivals != self.arrival_times[k:]
+        has_change = changed.any(axis=0)
+        first = np.where(has_change, k + changed.argmax(axis=0), patients)
+        last = np.where(has_change, patients - 1 - changed[::-1].argmax(axis=0), -1)
+        self.arrival_times[k:] = new_arrivals
+        self._sweep(first, last if self.queue_capacity == float('inf') else None)
+        return self.result()
+
+    def _sweep(self, first: np.ndarray, last_changed: np.ndarray | None) -> None:
+        """
+        Re-run every run from its patient first[r] on (same steps as multi_server_batch).
+        If last_changed is given, a run stops after patient i >= last_changed[r] whose state
+        after i equals the stored one.
+        """
+        patients = self.arrival_times.shape[0]
+        active = np.zeros(len(first), dtype=bool)
+        for i in range(int(first.min(initial=patients)), patients):
+            active |= first == i
+            rows = np.flatnonzero(active)
+            if not len(rows):
+                break
+            self.patients_swept += len(rows)
+            local = np.arange(len(rows))
+            arrival = self.arrival_times[i, rows]
+            free_at = self.free_at[i, rows]
+            doctor_idle = self.doctor_idle[i, rows]
+            last_departure = self.last_departure[i, rows]
+            empty = self.empty[i, rows] + np.maximum(0.0, arrival - last_departure)
+
+            doctor = free_at.argmin(axis=1)
+            free_time = free_at[local, doctor]
+            start_i = np.maximum(arrival, free_time)
+            end_i = start_i + self.service_times[i, rows]
+            if self.queue_capacity == float('inf'):
+                served = np.ones(len(rows), dtype=bool)
+            else:
+                busy = (free_at > arrival[:, None]).sum(axis=1)
+                waiting = (self.start[:i, rows] > arrival).sum(axis=0)
+                served = busy + waiting < self.servers + self.queue_capacity
+            doctor_idle[local[served], doctor[served]] += start_i[served] - free_time[served]
+            free_at[local[served], doctor[served]] = end_i[served]
+            self.start[i, rows] = np.where(served, start_i, np.nan)
+            self.end[i, rows] = np.where(served, end_i, np.nan)
+            last_departure = np.where(served, np.maximum(last_departure, end_i), last_departure)
+            queue_area = self.queue_area[i, rows] + np.where(served, end_i - arrival, 0.0)
+
+            if last_changed is not None:
+                # Same doctors' free times (hence latest departure) and no change ahead: the rest
+                # of the run repeats, only the totals so far differ
+                rejoined = (last_changed[rows] <= i) & (free_at == self.free_at[i + 1, rows]).all(axis=1)
+                done = rows[rejoined]
+                self.doctor_idle[i + 2:, done] += doctor_idle[rejoined] - self.doctor_idle[i + 1, done]
+                self.empty[i + 2:, done] += empty[rejoined] - self.empty[i + 1, done]
+                self.queue_area[i + 2:, done] += queue_area[rejoined] - self.queue_area[i + 1, done]
+                active[done] = False
+
+            self.free_at[i + 1, rows] = free_at
+            self.doctor_idle[i + 1, rows] = doctor_idle
+            self.empty[i + 1, rows] = empty
+            self.queue_area[i + 1, rows] = queue_area
+            self.last_departure[i + 1, rows] = last_departure
 
 class Schedule:
     """
     Represents the schedule of a clinic's queueing system.
     """
 
-    def __init__(self, working_hours: float=10.0, scheduled_arrival: float=16.0):
+    def __init__(self, working_hours: float=10.0, scheduled_arrival: float=16.0,
+                 appointment_times: np.ndarray | None=None):
         self.working_hours = working_hours  # hours
         self.scheduled_arrival = scheduled_arrival  # minutes
+        self.appointment_times = appointment_times  # booked times if not evenly spaced (see appointment_slots)
         self.arrival_times: list[float] = []
         self.service_start_times: list[float] = []
         self.service_end_times: list[float] = []
@@ -34,20 +310,38 @@ class Schedule:
         self.idle_time = 0.0
         self.waiting_times: list[float] = []
         self.overtime_time = 0.0
+        self.doctor_idle_times: list[float] = []
+        self.doctor_overtime_times: list[float] = []
+
+    def load_results(self, arrival_times: list[float] | np.ndarray, service_times: np.ndarray,
+                     service_start_times: list[float] | np.ndarray, service_end_times: list[float] | np.ndarray,
+                     doctor_idle_times: list[float], doctor_overtime_times: list[float],
+                     servers: int=1, queue_capacity: float=float('inf')) -> None:
+        """Fills the schedule with results computed elsewhere (e.g. a row of a ScheduleBatch)."""
+        self.arrival_times = arrival_times
+        self.service_times = service_times
+        self.servers = servers
+        self.queue_capacity = queue_capacity
+        self.service_start_times = service_start_times
+        self.service_end_times = service_end_times
+        self.doctor_idle_times = doctor_idle_times
+        self.doctor_overtime_times = doctor_overtime_times
+        self.idle_time = sum(doctor_idle_times)
+        self.overtime_time = sum(doctor_overtime_times)
 
     def setup_schedule(self, arrival_times: list[float], service_times: np.ndarray, servers: int=1, queue_capacity: float=float('inf')):
         """Sets up the schedule for potentially multiple servers.
 
         Approach:
-        - Keep a min-heap `busy` of service end times for busy servers.
+        - Keep a min-heap `free_at` of (time the doctor becomes free, doctor) for every doctor.
         - For each arrival:
-          * pop all busy servers that finished <= arrival (they become free)
+          * count busy doctors (free after the arrival)
           * compute current waiting size with bisect on non-decreasing service_start_times
           * if total in system >= servers + queue_capacity -> drop arrival
-          * if free server exists -> start at arrival
-          * else -> pop earliest end, start at that time (customer waits)
-          * push new end time into heap
-        This avoids sorting all end times each iteration.
+          * pop the earliest free doctor: start at arrival if already free,
+            else at the time they finish (customer waits)
+          * push the doctor back with the new end time
+        Tracking which doctor serves each patient gives idle time and overtime per doctor.
         """
         # save the variables (for potential future use)
         # Ensure all arrival_times are positive
@@ -58,48 +352,44 @@ class Schedule:
         self.servers = servers
         self.queue_capacity = queue_capacity
 
-        # min-heap of end times for busy servers
-        busy: list[float] = []
+        # min-heap of (free time, doctor); lowest doctor index wins ties
+        free_at: list[tuple[float, int]] = [(0.0, doctor) for doctor in range(servers)]
+        doctor_idle = [0.0] * servers
 
         for i, arrival in enumerate(self.arrival_times):
-            # free servers that finished before or at arrival
-            while busy and busy[0] <= arrival:
-                heapq.heappop(busy)
+            busy = sum(1 for free_time, _ in free_at if free_time > arrival)
 
             # number of previously scheduled starts that are still in the waiting line
             # service_start_times is non-decreasing, so bisect_right gives count of starts <= arrival
             started_by_arrival = bisect.bisect_right(self.service_start_times, arrival)
             waiting_count = len(self.service_start_times) - started_by_arrival
 
-            total_in_system = len(busy) + waiting_count
+            total_in_system = busy + waiting_count
             # if capacity is finite and the system is full, drop this arrival
             if total_in_system >= servers + queue_capacity:
                 # drop / reject arrival: do not create start/end for this customer
                 continue
 
-            if len(busy) < servers:
-                # free server available right now
-                # also means server was idle
-                num_idle = servers - len(busy)
-                if num_idle > 0:
-                    idle_time = arrival - (self.service_end_times[-1] if self.service_end_times else 0.0)
-                    self.idle_time += idle_time * num_idle
-                start_time = arrival
-            else:
-                # all servers busy -> wait until the earliest one finishes
-                earliest_end = heapq.heappop(busy)
-                start_time = earliest_end
+            free_time, doctor = heapq.heappop(free_at)
+            # doctor is free -> start now (doctor was idle since free_time)
+            # else -> customer waits until the doctor finishes
+            start_time = max(arrival, free_time)
+            doctor_idle[doctor] += start_time - free_time
 
             end_time = start_time + service_times[i]
             self.service_start_times.append(start_time)
             self.service_end_times.append(end_time)
-            heapq.heappush(busy, end_time)
+            heapq.heappush(free_at, (end_time, doctor))
 
-        max1, max2 = two_largest(self.service_end_times)
-        if max2 is not None and self.servers > 1:
-            self.overtime_time += max(0.0, max2 - self.working_hours * 60.0)
-        if max1 is not None:
-            self.overtime_time += max(0.0, max1 - self.working_hours * 60.0)
+        # every doctor stays (idle) until the last patient leaves; overtime is counted per doctor
+        session_end = max(self.service_end_times, default=0.0)
+        self.doctor_overtime_times = [0.0] * servers
+        for free_time, doctor in free_at:
+            doctor_idle[doctor] += session_end - free_time
+            self.doctor_overtime_times[doctor] = max(0.0, free_time - self.working_hours * 60.0)
+        self.doctor_idle_times = doctor_idle
+        self.idle_time = sum(doctor_idle)
+        self.overtime_time = sum(self.doctor_overtime_times)
 
     def get_schedule(self) -> list[tuple[int, float, float, float, float]]:
         return [
@@ -113,61 +403,208 @@ class Schedule:
         - states: list of number of patients in the system at each event time
         - staying_times: list of times spent in each state
         """
-        states: list[int] = []
-        staying_times: list[float] = []
-
-        # Logic:
-        # Use two pointers to traverse arrival_times and service_end_times
-        # Increment num_in_system on arrival, decrement on service end
-        arrival_ptr = 0
-        end_ptr = 0
-        current_time = 0.0
-        num_in_system = 0
-
-        # Modify list to account for servers > 1
-        at = self.arrival_times
-        et = sorted(self.service_end_times)
-
-        # Traverse until both lists are fully processed
-        while arrival_ptr < len(at) or end_ptr < len(et):
-            # Get the next arrival and service end times
-            # as long as pointers are within bounds
-            # or else set to infinity (to ensure the other event is chosen)
-            next_arrival = at[arrival_ptr] if arrival_ptr < len(at) else float('inf')
-            next_end = et[end_ptr] if end_ptr < len(et) else float('inf')
-
-            # Similar to exponential race
-            # If next arrival is earlier, 
-            # it means next patient arrives before current patient's service ends
-            # else it's a service end event
-            if next_arrival <= next_end:
-                # Arrival event
-                if current_time < next_arrival:
-                    states.append(num_in_system)
-                    staying_times.append(next_arrival - current_time)
-                    current_time = next_arrival
-                num_in_system += 1
-                arrival_ptr += 1
-            else:
-                # Service end event
-                if current_time < next_end:
-                    states.append(num_in_system)
-                    staying_times.append(next_end - current_time)
-                    current_time = next_end
-                num_in_system -= 1
-                end_ptr += 1
-
-        self.markov_chain = MarkovChain(states, staying_times)
+        # Count patients in the system over the merged arrival / service end timeline
+        # (arrivals first at equal times); one-run case of the vectorized batch builder
+        chains = MarkovChainBatch.from_times(
+            np.asarray(self.arrival_times, dtype=np.float64)[None, :],
+            np.asarray(self.service_end_times, dtype=np.float64)[None, :]
+        )
+        self.markov_chain = chains[0]
         return self.markov_chain
 
     def to_dataframe(self) -> pd.DataFrame:
         """Converts the schedule to a pandas DataFrame."""
+        slots = appointment_slots(len(self.service_start_times), self.scheduled_arrival, self.appointment_times)
         data: dict[str, list[float]] = {
             "patient": list(range(len(self.arrival_times))),
             "arrival": self.arrival_times,
             "start": self.service_start_times,
             "end": self.service_end_times,
             "service_time": [end - start for start, end in zip(self.service_start_times, self.service_end_times)],
-            "waiting_time": [max(0.0, start - i * self.scheduled_arrival) for i, start in enumerate(self.service_start_times)]
+            "waiting_time": [max(0.0, start - slot) for slot, start in zip(slots, self.service_start_times)]
+        }
+        return pd.DataFrame(data)
+
+class ScheduleBatch:
+    """
+    Columnar storage for the schedules of many runs of one simulation.
+
+    Times are kept in contiguous (runs x patients) arrays instead of one Schedule of
+    Python float lists per run; patients dropped by a finite queue have NaN start and
+    end times. Per-doctor idle time and overtime are kept as (runs x servers) float64
+    arrays, and the per-run session metrics computed during the scheduling pass as
+    float64 vectors. cost_derivatives holds the IPA derivatives of every run's cost components
+    (see Simulation.cost_gradient), control_variables and slot_service_sums the run's inputs
+    with known means (see Simulation.comprehensive_control_variate_comparison and
+    regression_control_variate_comparison), likelihood_ratios the importance-sampling weight of
+    every run (1 unless Simulation.tilt is set). Indexing returns a Schedule whose time lists are views on one row.
+    """
+    __slots__ = (
+        "working_hours", "scheduled_arrival", "appointment_times", "servers", "queue_capacity", "dtype",
+        "arrival_times", "service_start_times", "service_end_times",
+        "doctor_idle_times", "doctor_overtime_times",
+        "session_times", "queue_lengths", "doctor_utilizations", "cost_derivatives", "control_variables",
+        "slot_service_sums", "likelihood_ratios",
+    )
+    RUN_METRICS = ("session_times", "queue_lengths", "doctor_utilizations")
+    ARRAYS = (
+        "arrival_times", "service_start_times", "service_end_times", "doctor_idle_times", "doctor_overtime_times",
+        *RUN_METRICS, "cost_derivatives", "control_variables", "slot_service_sums", "likelihood_ratios"
+    )
+    # Axes of cost_derivatives after the run axis
+    DERIVATIVE_PARAMETERS = ("scheduled_arrival", "mean_service_time")
+    COST_COMPONENTS = ("idle_time", "waiting_time", "overtime")
+    # Columns of control_variables
+    CONTROL_VARIABLES = ("mean_service", "mean_unpunctuality", "total_service")
+    # Columns of slot_service_sums: blocks of consecutive appointments
+    SERVICE_BLOCKS = 4
+
+    def __init__(self, working_hours: float=10.0, scheduled_arrival: float=16.0, servers: int=1,
+                 queue_capacity: float=float('inf'), dtype: type[np.floating] = np.float64,
+                 appointment_times: np.ndarray | None=None):
+        self.working_hours = working_hours  # hours
+        self.scheduled_arrival = scheduled_arrival  # minutes
+        self.appointment_times = appointment_times  # booked times if not evenly spaced (see appointment_slots)
+        self.servers = servers
+        self.queue_capacity = queue_capacity
+        self.dtype = np.dtype(dtype)  # float64, or float32 to halve the memory of the time arrays
+        self.arrival_times = np.empty((0, 0), dtype=self.dtype)
+        self.service_start_times = np.empty((0, 0), dtype=self.dtype)
+        self.service_end_times = np.empty((0, 0), dtype=self.dtype)
+        self.doctor_idle_times = np.empty((0, servers))
+        self.doctor_overtime_times = np.empty((0, servers))
+        self.session_times = np.empty(0)  # first arrival (from 0) to last departure
+        self.queue_lengths = np.empty(0)  # time-average number of patients in the system
+        self.doctor_utilizations = np.empty(0)  # % of the session with anybody in the system
+        # d(cost component) / d(parameter) of every run, (runs x parameters x components)
+        self.cost_derivatives = np.empty((0, len(self.DERIVATIVE_PARAMETERS), len(self.COST_COMPONENTS)))
+        # mean and total service time and mean unpunctuality drawn for every run, (runs x controls)
+        self.control_variables = np.empty((0, len(self.CONTROL_VARIABLES)))
+        # total service time of the patients booked in each block of appointments, (runs x blocks)
+        self.slot_service_sums = np.empty((0, self.SERVICE_BLOCKS))
+        # nominal / sampling density of every run's draws (importance sampling)
+        self.likelihood_ratios = np.empty(0)
+
+    def extend(self, batch: dict[str, np.ndarray]) -> None:
+        """Appends the runs of a batch of (runs x ...) arrays, as returned by Simulation._run_batch()."""
+        for key in ("arrival_times", "service_start_times", "service_end_times"):
+            values = np.asarray(batch[key], dtype=self.dtype)
+            current = getattr(self, key)
+            setattr(self, key, np.ascontiguousarray(values) if not len(current) else np.concatenate([current, values]))
+        for key in ("doctor_idle_times", "doctor_overtime_times"):
+            setattr(self, key, np.concatenate([getattr(self, key), np.asarray(batch[key], dtype=np.float64)]))
+        runs = len(batch["doctor_idle_times"])
+        # Runs scheduled without derivatives or control variables have none
+        for key in ("cost_derivatives", "control_variables", "slot_service_sums"):
+            current = getattr(self, key)
+            values = batch.get(key, np.full((runs,) + current.shape[1:], np.nan))
+            setattr(self, key, np.concatenate([current, np.asarray(values, dtype=np.float64)]))
+        # Runs drawn from the nominal distributions have weight 1
+        ratios = batch.get("likelihood_ratios", np.ones(runs))
+        self.likelihood_ratios = np.concatenate([self.likelihood_ratios, np.asarray(ratios, dtype=np.float64)])
+        if not all(key in batch for key in self.RUN_METRICS):
+            # Session metrics were not computed in the scheduling pass: derive them from the event timeline
+            chains = self._markov_chains(batch["arrival_times"], batch["service_start_times"], batch["service_end_times"])
+            batch = {
+                "session_times": chains.total_times,
+                "queue_lengths": chains.get_average_queue_length(),
+                "doctor_utilizations": chains.get_doctor_utilization(),
+            }
+        for key in self.RUN_METRICS:
+            setattr(self, key, np.concatenate([getattr(self, key), np.asarray(batch[key], dtype=np.float64)]))
+
+    @staticmethod
+    def _markov_chains(arrival_times: np.ndarray, service_start_times: np.ndarray,
+                       service_end_times: np.ndarray) -> MarkovChainBatch:
+        # dropped patients (NaN start) never enter the system
+        arrival_times = np.where(np.isnan(service_start_times), np.nan, arrival_times)
+        return MarkovChainBatch.from_times(arrival_times, service_end_times)
+
+    def to_markov_chains(self) -> MarkovChainBatch:
+        """Markov chains of the number of patients in the system for every stored run."""
+        return self._markov_chains(self.arrival_times, self.service_start_times, self.service_end_times)
+
+    @property
+    def idle_times(self) -> np.ndarray:
+        """Total idle time of all doctors, per run."""
+        return self.doctor_idle_times.sum(axis=1)
+
+    @property
+    def overtime_times(self) -> np.ndarray:
+        """Total overtime of all doctors, per run."""
+        return self.doctor_overtime_times.sum(axis=1)
+
+    @property
+    def waiting_times(self) -> np.ndarray:
+        """(runs x patients) waiting time past each patient's appointment slot, NaN for dropped patients."""
+        slots = appointment_slots(self.service_start_times.shape[1], self.scheduled_arrival, self.appointment_times)
+        return np.maximum(0.0, self.service_start_times - slots)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the stored arrays."""
+        return sum(getattr(self, key).nbytes for key in self.ARRAYS)
+
+    def to_batch(self) -> dict[str, np.ndarray]:
+        """All stored arrays, in the form extend() takes."""
+        return {key: getattr(self, key) for key in self.ARRAYS}
+
+    def to_dataframe(self, index: int) -> pd.DataFrame:
+        """
+        Schedule DataFrame of one run, with the columns of Schedule.to_dataframe().
+        Dropped patients keep their row, with NaN start, end and waiting time.
+        """
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"Run {index} out of range for {len(self)} runs.")
+        index %= len(self)
+        return self._frame(slice(index, index + 1), with_run_id=False)
+
+    def to_long_dataframe(self) -> pd.DataFrame:
+        """All runs as one long-format DataFrame with a run_id column (0-based, as for indexing)."""
+        return self._frame(slice(None), with_run_id=True)
+
+    def _frame(self, runs: slice, with_run_id: bool) -> pd.DataFrame:
+        arrival = self.arrival_times[runs]
+        start = self.service_start_times[runs]
+        end = self.service_end_times[runs]
+        count, patients = arrival.shape
+        data: dict[str, np.ndarray] = {
+            "patient": np.tile(np.arange(patients), count),
+            "arrival": arrival.ravel(),
+            "start": start.ravel(),
+            "end": end.ravel(),
+            "service_time": (end - start).ravel(),
+            "waiting_time": np.maximum(0.0, start - appointment_slots(patients, self.scheduled_arrival, self.appointment_times)).ravel(),
         }
-        return pd.DataFrame(data)
\ No newline at end of file
+        if with_run_id:
+            data = {"run_id": np.repeat(np.arange(count), patients), **data}
+        return pd.DataFrame(data)
+
+    def __len__(self) -> int:
+        return len(self.doctor_idle_times)
+
+    def __getitem__(self, index: int) -> Schedule:
+        """Per-run Schedule view (rows are not copied unless the run dropped patients)."""
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"Run {index} out of range for {len(self)} runs.")
+        start = self.service_start_times[index]
+        end = self.service_end_times[index]
+        served = ~np.isnan(start)
+        if not served.all():
+            start, end = start[served], end[served]
+        schedule = Schedule(self.working_hours, self.scheduled_arrival, self.appointment_times)
+        schedule.load_results(
+            self.arrival_times[index],
+            end - start,
+            start,
+            end,
+            doctor_idle_times=self.doctor_idle_times[index].tolist(),
+            doctor_overtime_times=self.doctor_overtime_times[index].tolist(),
+            servers=self.servers,
+            queue_capacity=self.queue_capacity
+        )
+        return schedule
+
+    def __iter__(self) -> Iterator[Schedule]:
+        for index in range(len(self)):
+            yield self[index]
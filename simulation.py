@@ -1,16 +1,53 @@
 from distribution import Lognormal, TruncatedNormal
-from schedule import Schedule
+from schedule import Schedule, ScheduleBatch, PrefixSchedule, appointment_slots, lindley_batch, multi_server_batch
 import pandas as pd
-from typing import Any
+from typing import TYPE_CHECKING, Any, Iterator
 import sqlite3
 import numpy as np
 import os
 import tempfile
 from tqdm import tqdm
-from summary import Summary, Statistic, Schedules, WaitingTimes, PatientMetrics, Averages, SystemMetrics
-from scipy.stats import truncnorm
+from summary import Summary, Statistic, Schedules, WaitingTimes, PatientMetrics, Averages, SystemMetrics, SummaryAccumulator, RunningStats, ImportanceSampling, weighted_percentile
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from collections import deque
+from contextlib import nullcontext
+from statistics import NormalDist
+import math
+from draws import DrawBank
+
+if TYPE_CHECKING:
+    from checkpoint import Checkpoint
+
+def concat_batches(batches: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    """Join run arrays returned by several workers, keeping run order."""
+    return {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}
+
+def replication_means(values: np.ndarray, runs: int) -> np.ndarray:
+    """
+    Means of consecutive blocks of `runs` per-run values along the first axis: the independent
+    replications of antithetic (pairs) or rqmc (randomizations) sampling, see Simulation.replication_runs.
+    """
+    return values.reshape(len(values) // runs, runs, *values.shape[1:]).mean(axis=1)
+
+def _simulate_chunk(config: dict[str, Any], streams: list[tuple[int, np.random.SeedSequence]]) -> dict[str, np.ndarray]:
+    """Worker entry point: simulate the runs of the given random streams and return compact arrays."""
+    return Simulation(**config)._run_batch(streams)
 
 class Simulation:
+    # How random draws are generated:
+    # - "per_run": a fresh generator per run (seed + i), same draws as unit_test()
+    # - "batch": one generator per sampler fills the (runs x patients) matrix of RUNS_PER_STREAM runs at a time
+    # - "rqmc": randomized quasi-Monte Carlo; every RQMC_POINTS runs are one scrambled Sobol point set
+    #   (one dimension per patient, see DrawBank.generate), and independent scramblings give the error bars
+    # With antithetic=True every stream gives pairs of runs from standard normals Z and -Z (see _draw)
+    # With tilt != 0 runs are importance-sampled and weighted by their likelihood ratios (see choose_tilt)
+    SAMPLING_MODES = ("per_run", "batch", "rqmc")
+    RUNS_PER_STREAM = 1000
+    RQMC_POINTS = 128  # a power of two keeps the Sobol points balanced
+    # Rare events for importance sampling: event -> default level (see tail_probability)
+    TAIL_EVENTS = {"overtime": 0.0, "long_wait": 15.0}
+    PILOT_SEED_OFFSET = 10 ** 9  # pilot runs of choose_tilt() use seeds from seed + PILOT_SEED_OFFSET on
+
     def __init__(self,
                  working_hours: float,
                  scheduled_arrival: float,
@@ -20,8 +57,16 @@ class Simulation:
                  doctors: int=1,
                  queue_capacity: float=float('inf'),
                  cost_params: tuple[float, float, float]=(1.0, 0.2, 1.5),
-                 seed: int | None=None
+                 seed: int | None=None,
+                 sampling: str="per_run",
+                 storage_dtype: type[np.floating]=np.float64,
+                 draws: DrawBank | None=None,
+                 appointment_times: np.ndarray | list[float] | None=None,
+                 antithetic: bool=False,
+                 tilt: float=0.0
                  ):
+        if sampling not in self.SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode '{sampling}'. Choose from {self.SAMPLING_MODES}.")
         self.working_hours = working_hours
         self.scheduled_arrival = scheduled_arrival
         self.mean_service_time = mean_service_time
@@ -29,106 +74,623 @@ class Simulation:
         self.queue_capacity = queue_capacity
         self.iat_distribution = iat_distr
         self.service_distribution = service_distr
-        self.schedules: list[Schedule] = []
+        self.storage_dtype = storage_dtype  # float32 halves the memory of stored schedules
         self.cost_params = cost_params  # idle, waiting, overtime
         self.seed = seed
+        self.sampling = sampling
+        self.antithetic = antithetic  # runs come in pairs (2k, 2k + 1) from mirrored draws
+        self.tilt = tilt  # importance sampling: shift of the standard normals behind every draw
+        self.draws = draws  # shared standard normals (common random numbers), used by serial runs
+        # Booked time of every patient; None books patient i at i * scheduled_arrival
+        self.appointment_times = None if appointment_times is None else np.asarray(appointment_times, dtype=np.float64)
         self.control_variate_info: dict[str, Any] = {}  # Store control variate information if used
+        self.precision_info: dict[str, Any] = {}  # Set by simulate_until()
         self.setup()
 
     def setup(self) -> None:
         """Sets up attributes that depend on other parameters."""
         self.number_of_patients = int(self.working_hours * 60 // self.mean_service_time)
+        if self.appointment_times is not None:
+            if self.appointment_times.ndim != 1 or np.any(np.diff(self.appointment_times) < 0):
+                raise ValueError("appointment_times must be a non-decreasing 1-D sequence of times.")
+            # one patient per appointment
+            self.number_of_patients = len(self.appointment_times)
         self.service_distribution = Lognormal(desired_mean=self.mean_service_time)
+        # Results of earlier parameters no longer apply
+        self.schedules = self._new_schedule_batch()
+        self.accumulator: SummaryAccumulator | None = None  # set when runs are streamed instead of stored
+        self.streams_used = 0  # random streams consumed so far; further simulate() calls continue after them
+
+    def _new_schedule_batch(self) -> ScheduleBatch:
+        return ScheduleBatch(
+            self.working_hours, self.scheduled_arrival, self.doctors, self.queue_capacity, dtype=self.storage_dtype,
+            appointment_times=self.appointment_times
+        )
+
+    def appointment_slots(self) -> np.ndarray:
+        """Booked time of every patient: appointment_times if set, else i * scheduled_arrival."""
+        return appointment_slots(self.number_of_patients, self.scheduled_arrival, self.appointment_times)
 
     def unit_test(self, seed: int | None) -> Schedule:
-        service_times = self.service_distribution.sample(size=self.number_of_patients, seed=seed)
-        interarrival_deviation = self.iat_distribution.sample(size=self.number_of_patients, seed=seed)
-        arrival_times = [i * self.scheduled_arrival + dev for i, dev in enumerate(interarrival_deviation)]
+        """
+        Simulates a single run and appends it to the stored schedules. With antithetic sampling
+        the pair of runs is stored, and the run from the seed's own draws is returned.
+        """
+        runs = 2 if self.antithetic else 1
+        self._store_batch(self._run_batch([(runs, seed)]))
+        return self.schedules[-runs]
 
-        schedule = Schedule(self.working_hours, self.scheduled_arrival)
-        schedule.setup_schedule(
-            arrival_times,
-            service_times,
-            servers=self.doctors,
-            queue_capacity=self.queue_capacity
-            )
-        self.schedules.append(schedule)
-        return schedule
+    def simulate(self, number_of_runs: int=1, workers: int | None=None, keep_schedules: bool=True) -> ScheduleBatch:
+        """
+        Run number_of_runs replications and store their schedules.
 
-    def simulate(self, number_of_runs: int=1) -> list[Schedule]:
-        for i in range(number_of_runs):
-            self.unit_test(seed = None if self.seed is None else self.seed + i)
+        Args:
+            number_of_runs: Number of replications
+            workers: If set, spread the runs over a process pool of this size.
+                     Draws then come from np.random.SeedSequence(seed).spawn() child streams,
+                     so results are bit-identical for any worker count. With per_run sampling
+                     these differ from the serial seed + i streams used when workers is None;
+                     batch sampling always uses the child streams.
+            keep_schedules: If False, runs are folded into a SummaryAccumulator batch by batch
+                            and discarded, so memory stays constant in number_of_runs.
+                            summary() then reports streamed estimates (sketched 95th percentile).
+
+        With antithetic sampling number_of_runs must be even: run 2k + 1 mirrors the draws of run 2k.
+        With rqmc sampling it must be a multiple of RQMC_POINTS (see replication_runs).
+
+        Calling simulate() again adds runs on fresh streams (seed + number of earlier runs onwards),
+        so with per_run sampling simulate(a) followed by simulate(b) equals simulate(a + b).
+        """
+        self._start_runs(keep_schedules)
+        for batch in self._iter_batches(number_of_runs, workers):
+            self._add_batch(batch, keep_schedules)
         return self.schedules
 
+    def simulate_until(self, rel_half_width: float=0.01, max_runs: int=100000, batch_runs: int=1000,
+                       confidence: float=0.95, workers: int | None=None, keep_schedules: bool=True,
+                       checkpoint: "Checkpoint | None"=None) -> dict[str, Any]:
+        """
+        Run batches of batch_runs replications until the confidence interval of the total cost
+        per run is narrower than rel_half_width times its mean, or max_runs runs are done.
+
+        Keeps a running mean and variance of the per-run costs (see run_costs), so quiet
+        configurations stop early and only noisy ones go up to max_runs. With antithetic or rqmc
+        sampling the interval comes from the replication means (see replications), and batches
+        are rounded down to whole replications (at least one). With workers, one process pool
+        serves the whole loop and every batch has at least one chunk of RUNS_PER_STREAM runs per
+        worker, so all of them are busy. Stored runs from earlier simulate() calls count towards
+        the estimate. Runs are stored or streamed as in simulate(); summary() works as usual afterwards.
+        With a checkpoint, chunks already on disk are read back instead of simulated and new ones
+        are written as they finish (see Checkpoint.iter_groups): the same batches are checked in the
+        same order, so a resumed run stops where an uninterrupted one would.
+
+        Returns (and keeps in self.precision_info) the runs used, the mean cost, the achieved
+        half width and relative half width of the interval, and whether the target was met.
+        """
+        self._require_unweighted()
+        self._start_runs(keep_schedules)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        costs = RunningStats()  # of the independent replications
+        runs = 0
+        if keep_schedules and len(self.schedules):
+            costs.update(self.replications(self.run_costs()))
+            runs = len(self.schedules)
+
+        def half_width() -> float:
+            return z * costs.std(ddof=1) / math.sqrt(costs.count) if costs.count > 1 else float('inf')
+
+        block = self.replication_runs
+        if workers is not None:
+            batch_runs = max(batch_runs, workers * self.RUNS_PER_STREAM)
+        with ProcessPoolExecutor(max_workers=workers) if workers is not None else nullcontext() as pool:
+            while runs < max_runs and not (costs.count > 1 and half_width() <= rel_half_width * abs(costs.mean)):
+                next_runs = min(max(batch_runs // block, 1) * block, (max_runs - runs) // block * block)
+                if next_runs == 0:
+                    break
+                start = self.streams_used
+                groups = self._stream_groups(next_runs, spawn=workers is not None)
+                batches = self._iter_groups(groups, workers, pool) if checkpoint is None \
+                    else checkpoint.iter_groups(self, groups, start, workers, pool)
+                for batch in batches:
+                    batch_costs = self._costs(self._add_batch(batch, keep_schedules))
+                    costs.update(self.replications(batch_costs))
+                    runs += len(batch_costs)
+
+        self.precision_info = {
+            "runs": runs,
+            "mean_cost": costs.mean,
+            "half_width": half_width(),
+            "rel_half_width": half_width() / abs(costs.mean) if costs.mean else float('inf'),
+            "confidence": confidence,
+            "converged": half_width() <= rel_half_width * abs(costs.mean),
+        }
+        return self.precision_info
+
+    def _start_runs(self, keep_schedules: bool) -> None:
+        if self.tilt and not keep_schedules:
+            raise ValueError("Importance-sampled runs are weighted run by run: simulate them with keep_schedules=True.")
+        if (keep_schedules and self.accumulator is not None) or (not keep_schedules and len(self.schedules)):
+            raise RuntimeError("Cannot mix stored and streamed runs in one simulation. Call setup() to start over.")
+        if not keep_schedules and self.accumulator is None:
+            self.accumulator = SummaryAccumulator()
+
+    def _add_batch(self, batch: dict[str, np.ndarray], keep_schedules: bool) -> ScheduleBatch:
+        """Store (or fold into the accumulator) one batch from _iter_batches(); returns its runs."""
+        runs = self._new_schedule_batch()
+        runs.extend(batch)
+        if keep_schedules:
+            self._store_batch(batch)
+        else:
+            self.accumulator.update(self._run_metrics(runs), self.number_of_patients)
+        return runs
+
+    def _streams(self, number_of_runs: int, spawn: bool, start: int=0) -> list[tuple[int, int | np.random.SeedSequence | None]]:
+        """
+        Random streams covering number_of_runs runs, as (runs in stream, seed) pairs,
+        starting after the first `start` streams (so later calls continue instead of repeating).
+        - per_run: one stream per run, seed + i (or child i of SeedSequence(seed) if spawn is set)
+        - batch: one SeedSequence(seed) child per RUNS_PER_STREAM runs
+        - rqmc: one SeedSequence(seed) child (scrambling) per RQMC_POINTS runs
+        With antithetic sampling a per_run stream covers a pair of runs.
+        """
+        if number_of_runs % self.replication_runs:
+            raise ValueError(f"Runs come in replications of {self.replication_runs} ({self.sampling} sampling"
+                             f"{', antithetic' if self.antithetic else ''}): got number_of_runs = {number_of_runs}.")
+        if self.sampling in ("batch", "rqmc"):
+            size = self.RUNS_PER_STREAM if self.sampling == "batch" else self.RQMC_POINTS
+            blocks = [self._child_stream(start + b) for b in range(-(-number_of_runs // size))]
+            return [(min(size, number_of_runs - b * size), block) for b, block in enumerate(blocks)]
+        runs = 2 if self.antithetic else 1
+        if spawn:
+            return [(runs, self._child_stream(start + i)) for i in range(number_of_runs // runs)]
+        return [(runs, None if self.seed is None else self.seed + start + i) for i in range(number_of_runs // runs)]
+
+    def _child_stream(self, index: int) -> np.random.SeedSequence:
+        """Child `index` of SeedSequence(seed), the same as SeedSequence(seed).spawn(index + 1)[index]."""
+        return np.random.SeedSequence(self.seed, spawn_key=(index,))
+
+    def _stream_groups(self, number_of_runs: int, spawn: bool) -> list[list[tuple[int, int | np.random.SeedSequence | None]]]:
+        """
+        The next unused streams for number_of_runs runs, grouped into chunks of about RUNS_PER_STREAM runs.
+        Chunks do not depend on the worker count, so neither does anything reduced chunk by chunk.
+        """
+        streams = self._streams(number_of_runs, spawn, start=self.streams_used)
+        self.streams_used += len(streams)
+        groups: list[list[tuple[int, int | np.random.SeedSequence | None]]] = [[]]
+        runs_in_group = 0
+        for stream in streams:
+            if runs_in_group >= self.RUNS_PER_STREAM:
+                groups.append([])
+                runs_in_group = 0
+            groups[-1].append(stream)
+            runs_in_group += stream[0]
+        return [group for group in groups if group]
+
+    def _iter_batches(self, number_of_runs: int, workers: int | None) -> Iterator[dict[str, np.ndarray]]:
+        """Yields the run arrays of every chunk in run order, simulated here or on a process pool of `workers`."""
+        return self._iter_groups(self._stream_groups(number_of_runs, spawn=workers is not None), workers)
+
+    def _iter_groups(self, groups: list[list[tuple[int, int | np.random.SeedSequence | None]]],
+                     workers: int | None, pool: Executor | None = None) -> Iterator[dict[str, np.ndarray]]:
+        """
+        Yields the run arrays of the given chunks of streams (see _stream_groups) in order,
+        simulated on pool if given, else on a new process pool of `workers` (here if workers is None).
+        """
+        if workers is None:
+            for group in groups:
+                yield self._run_batch(group)
+            return
+        if pool is None:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                yield from self._iter_groups(groups, workers, pool)
+            return
+
+        config = self._config()
+        pending: deque[Future[dict[str, np.ndarray]]] = deque()
+        for group in groups:
+            pending.append(pool.submit(_simulate_chunk, config, group))
+            # Bounded look-ahead: finished chunks wait in memory only until their turn
+            if len(pending) > 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _submit_runs(self, pool: Executor, number_of_runs: int) -> list[tuple[int, Future[dict[str, np.ndarray]]]]:
+        """
+        Submit every chunk of runs to the pool (see _stream_groups), as (streams in chunk, future) pairs.
+        A run draws from the same stream whatever the pool size.
+        """
+        config = self._config()
+        return [(len(group), pool.submit(_simulate_chunk, config, group)) for group in self._stream_groups(number_of_runs, spawn=True)]
+
+    def _config(self) -> dict[str, Any]:
+        """Constructor arguments that recreate this simulation (without results) in a worker process."""
+        return {
+            "working_hours": self.working_hours,
+            "scheduled_arrival": self.scheduled_arrival,
+            "mean_service_time": self.mean_service_time,
+            "iat_distr": self.iat_distribution,
+            "service_distr": self.service_distribution,
+            "doctors": self.doctors,
+            "queue_capacity": self.queue_capacity,
+            "cost_params": self.cost_params,
+            "seed": self.seed,
+            "sampling": self.sampling,
+            "storage_dtype": self.storage_dtype,
+            "appointment_times": self.appointment_times,
+            "antithetic": self.antithetic,
+            "tilt": self.tilt,
+        }
+
+    def _draw(self, streams: list[tuple[int, int | np.random.SeedSequence | None]]) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (service_times, interarrival_deviation) matrices of shape (runs x patients) for the given streams."""
+        n = self.number_of_patients
+        if self.antithetic or self.draws is not None or self.sampling == "rqmc" or self.tilt:
+            # Both samplers are monotone maps of the normals, so with rqmc they are inverse CDFs of the
+            # Sobol points; importance sampling shifts the normals by tilt (see likelihood_ratios)
+            normals = self._standard_normals(streams) + self.tilt
+            return self.service_distribution.from_standard_normal(normals), self.iat_distribution.from_standard_normal(normals)
+        if self.sampling == "batch":
+            service_parts: list[np.ndarray] = []
+            deviation_parts: list[np.ndarray] = []
+            for runs, seed in streams:
+                # Like unit_test(), both samplers start from the same seed (and so share one normal sequence)
+                service_parts.append(self.service_distribution.sample_batch(runs, n, seed))
+                deviation_parts.append(self.iat_distribution.sample_batch(runs, n, seed))
+            return np.concatenate(service_parts), np.concatenate(deviation_parts)
+
+        service_times = np.empty((len(streams), n))
+        interarrival_deviation = np.empty((len(streams), n))
+        for row, (_, seed) in enumerate(streams):
+            # Same draws as unit_test(): both samplers get the run's seed
+            service_times[row] = self.service_distribution.sample(size=n, seed=seed)
+            interarrival_deviation[row] = self.iat_distribution.sample(size=n, seed=seed)
+        return service_times, interarrival_deviation
+
+    def _standard_normals(self, streams: list[tuple[int, int | np.random.SeedSequence | None]]) -> np.ndarray:
+        """
+        (runs x patients) standard normals of the given streams, shared through the DrawBank if set.
+        With antithetic sampling they are drawn for half the runs (one row per per_run stream) and
+        interleaved with their mirror image -Z, so that run 2k + 1 mirrors run 2k: long services and
+        late arrivals of one run are short services and early arrivals of its partner.
+        """
+        n = self.number_of_patients
+        if self.antithetic:
+            streams = [(1 if self.sampling == "per_run" else runs // 2, seed) for runs, seed in streams]
+        normals = self.draws.standard_normals(streams, n, self.sampling) if self.draws is not None \
+            else DrawBank.generate(streams, n, self.sampling)
+        if not self.antithetic:
+            return normals
+        paired = np.empty((2 * len(normals), n))
+        paired[0::2] = normals
+        paired[1::2] = -normals
+        return paired
+
+    def _run_batch(self, streams: list[tuple[int, int | np.random.SeedSequence | None]]) -> dict[str, np.ndarray]:
+        """
+        Simulate every run of the given random streams, returned as (runs x ...) arrays.
+        All runs go through the vectorized scheduling kernels at once (Lindley recursion for a
+        single doctor with an unlimited queue, array-backed multi-server kernel otherwise).
+        With per_run sampling the draws are identical to unit_test(), so the resulting
+        schedules match the per-run path exactly.
+        """
+        return self._schedule_batch(*self._draw(streams))
+
+    def _schedule_batch(self, service_times: np.ndarray, interarrival_deviation: np.ndarray) -> dict[str, np.ndarray]:
+        """Schedule (runs x patients) matrices of draws; see _run_batch()."""
+        slots = self.appointment_slots()
+        unsorted_arrivals = np.maximum(slots + interarrival_deviation, 0.0)
+        order = np.argsort(unsorted_arrivals, axis=1)
+        arrival_times = np.take_along_axis(unsorted_arrivals, order, axis=1)
+        tangents = self._input_tangents(service_times, unsorted_arrivals, order)
+
+        result = self._schedule(arrival_times, service_times, tangents=tangents)
+        end = result["service_end_times"]
+        free_at = result["doctor_free_times"]
+        # Doctors stay (idle) until the last patient leaves; overtime is counted per doctor
+        session_end = np.fmax.reduce(end, axis=1, initial=0.0)
+        # Session metrics of the event timeline (what MarkovChain gives per run), without building it
+        has_session = session_end > 0
+        session_time = np.where(has_session, session_end, 1.0)
+        return {
+            "arrival_times": arrival_times,
+            "service_start_times": result["service_start_times"],
+            "service_end_times": end,
+            "doctor_idle_times": result["doctor_idle_times"] + (session_end[:, None] - free_at),
+            "doctor_overtime_times": np.maximum(0.0, free_at - self.working_hours * 60.0),
+            "session_times": session_end,
+            "queue_lengths": np.where(has_session, result["queue_areas"] / session_time, 0.0),
+            "doctor_utilizations": np.where(has_session, (session_end - result["empty_times"]) / session_time * 100, 0.0),
+            "cost_derivatives": self._cost_derivatives(result, tangents[1]),
+            # Inputs with known means, for control variates (ScheduleBatch.CONTROL_VARIABLES)
+            "control_variables": np.column_stack([
+                service_times.mean(axis=1), interarrival_deviation.mean(axis=1), service_times.sum(axis=1)
+            ]),
+            "slot_service_sums": np.column_stack([
+                service_times[:, first:last].sum(axis=1) for first, last in self._service_blocks()
+            ]),
+            "likelihood_ratios": self._likelihood_ratios(service_times),
+        }
+
+    def _likelihood_ratios(self, service_times: np.ndarray) -> np.ndarray:
+        """
+        Nominal over sampling density of every run's normals. With tilt the normals z of a run are
+        N(tilt, 1) instead of N(0, 1), so the ratio is exp(-tilt * sum(z) + patients * tilt^2 / 2).
+        The normals are read back from the service times, z = (log(service) - mu) / sigma.
+        """
+        if not self.tilt:
+            return np.ones(len(service_times))
+        distribution = self.service_distribution
+        normal_sums = ((np.log(service_times) - distribution.mu) / distribution.sigma).sum(axis=1)
+        return np.exp(-self.tilt * normal_sums + service_times.shape[1] * self.tilt ** 2 / 2)
+
+    def _service_blocks(self) -> list[tuple[int, int]]:
+        """(first, last) patient of each of the ScheduleBatch.SERVICE_BLOCKS blocks of consecutive appointments."""
+        bounds = np.linspace(0, self.number_of_patients, ScheduleBatch.SERVICE_BLOCKS + 1).round().astype(int)
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    def _schedule(self, arrival_times: np.ndarray, service_times: np.ndarray, **options: Any) -> dict[str, np.ndarray]:
+        """The scheduling kernel for this clinic: Lindley recursion for one doctor with an unlimited queue, else multi-server."""
+        if self.doctors == 1 and self.queue_capacity == float('inf'):
+            return lindley_batch(arrival_times, service_times, **options)
+        return multi_server_batch(arrival_times, service_times, servers=self.doctors, queue_capacity=self.queue_capacity, **options)
+
+    def slot_costs(self, appointment_times: np.ndarray, service_times: np.ndarray,
+                   interarrival_deviation: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Total cost of every run (as run_costs()) if patients are booked at appointment_times
+        (non-decreasing, one per column of the draws), and the pathwise gradient of the mean
+        cost with respect to every appointment time.
+
+        One forward pass of the scheduling kernel over all runs records whom each patient waited
+        for; a reverse sweep over the patients then hands the cost sensitivity of every start and
+        end back along its busy period to the arrival that opened it. An appointment moves its
+        patient's arrival (unless clipped at 0) and the slot that waiting is measured from.
+        Candidate vectors can thus be compared on fixed draws in one vectorized call each.
+
+        Returns (runs) costs and (patients) gradient.
+        """
+        slots = np.asarray(appointment_times, dtype=np.float64)
+        runs, n = service_times.shape
+        rows = np.arange(runs)
+        unsorted_arrivals = np.maximum(slots + interarrival_deviation, 0.0)
+        order = np.argsort(unsorted_arrivals, axis=1)
+        result = self._schedule(np.take_along_axis(unsorted_arrivals, order, axis=1), service_times, predecessors=True)
+        start = result["service_start_times"]
+        end = result["service_end_times"]
+        free_at = result["doctor_free_times"]
+        served = ~np.isnan(start)
+        working_minutes = self.working_hours * 60.0
+        idle_cost, waiting_cost, overtime_cost = self.cost_params
+        costs = self._result_costs(result, slots)
+
+        # Cost sensitivity of every start (waiting) and end (session end for idle time, doctors' finish for overtime)
+        start_adjoint = np.where(served & (start > slots), (waiting_cost * n / served.sum(axis=1))[:, None], 0.0)
+        end_adjoint = np.zeros((runs, n))
+        end_adjoint[rows, np.argmax(np.where(served, end, -np.inf), axis=1)] += idle_cost * self.doctors
+        last_patients = result["last_patients"]
+        for doctor in range(last_patients.shape[1]):
+            over = (last_patients[:, doctor] >= 0) & (free_at[:, doctor] > working_minutes)
+            end_adjoint[rows[over], last_patients[over, doctor]] += overtime_cost
+
+        # Reverse sweep (patient-major for contiguous columns): a start is moved by the end it
+        # waited for, or else by the own arrival
+        predecessors = result["predecessors"].T
+        start_adjoint_by_patient = np.ascontiguousarray(start_adjoint.T)
+        end_adjoint = np.ascontiguousarray(end_adjoint.T)
+        arrival_adjoint = np.empty((n, runs))
+        for i in range(n - 1, -1, -1):
+            adjoint = start_adjoint_by_patient[i] + end_adjoint[i]
+            waited = predecessors[i] >= 0
+            # runs that did not wait add 0 to their own (already swept) end
+            end_adjoint[np.where(waited, predecessors[i], i), rows] += np.where(waited, adjoint, 0.0)
+            arrival_adjoint[i] = np.where(waited, 0.0, adjoint)
+
+        # Back from arrival order to booking order; waiting of the i-th arrival is measured from slot i
+        gradient = np.empty((runs, n))
+        np.put_along_axis(gradient, order, arrival_adjoint.T, axis=1)
+        gradient = np.where(unsorted_arrivals > 0, gradient, 0.0) - start_adjoint
+        return costs, gradient.mean(axis=0)
+
+    def _result_costs(self, result: dict[str, np.ndarray], slots: np.ndarray) -> np.ndarray:
+        """Total cost of every run (as run_costs()) straight from a scheduling kernel's result."""
+        start = result["service_start_times"]
+        free_at = result["doctor_free_times"]
+        session_end = np.fmax.reduce(result["service_end_times"], axis=1, initial=0.0)
+        idle = (result["doctor_idle_times"] + (session_end[:, None] - free_at)).sum(axis=1)
+        waiting = np.nanmean(np.maximum(0.0, start - slots), axis=1) * start.shape[1]
+        overtime = np.maximum(0.0, free_at - self.working_hours * 60.0).sum(axis=1)
+        return idle * self.cost_params[0] + waiting * self.cost_params[1] + overtime * self.cost_params[2]
+
+    def prefix_schedule(self, appointment_times: np.ndarray, service_times: np.ndarray,
+                        interarrival_deviation: np.ndarray) -> PrefixSchedule:
+        """
+        Schedules of the given (runs x patients) draws with patients booked at appointment_times,
+        keeping the state after every patient so that moved appointments can be re-costed with
+        reschedule() without simulating every patient again.
+        """
+        arrival_times = np.sort(np.maximum(np.asarray(appointment_times, dtype=np.float64) + interarrival_deviation, 0.0), axis=1)
+        return PrefixSchedule(arrival_times, service_times, servers=self.doctors, queue_capacity=self.queue_capacity)
+
+    def reschedule(self, prefix: PrefixSchedule, appointment_times: np.ndarray,
+                   interarrival_deviation: np.ndarray) -> np.ndarray:
+        """
+        Move the appointments of a prefix_schedule() to appointment_times and return the new total
+        cost of every run. Per run only the patients from the first arrival that changes onwards are
+        swept (see PrefixSchedule.reevaluate_from), so moving a late appointment is cheap.
+        """
+        slots = np.asarray(appointment_times, dtype=np.float64)
+        arrival_times = np.sort(np.maximum(slots + interarrival_deviation, 0.0), axis=1)
+        return self._result_costs(prefix.reevaluate_from(0, arrival_times), slots)
+
+    def _input_tangents(self, service_times: np.ndarray, unsorted_arrivals: np.ndarray,
+                        order: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Derivatives of the sorted arrival times and of the service times with respect to
+        each of ScheduleBatch.DERIVATIVE_PARAMETERS, as (parameters x runs x patients) arrays.
+
+        Patient i arrives at max(slot i + deviation, 0), which moves by i per minute of slot
+        length unless clipped at 0 (custom appointment_times are stretched in proportion,
+        by slot / scheduled_arrival). Service times are exp(mu + sigma * z) with
+        mu = log(mean_service_time) - sigma^2 / 2 and a fixed sigma, so they scale with the mean:
+        d service / d mean_service_time = service / mean_service_time.
+        """
+        arrival_slope = np.where(unsorted_arrivals > 0, self._slot_tangent(), 0.0)
+        zeros = np.zeros(service_times.shape)
+        arrival_tangents = np.stack([np.take_along_axis(arrival_slope, order, axis=1), zeros])
+        service_tangents = np.stack([zeros, service_times / self.mean_service_time])
+        return arrival_tangents, service_tangents
+
+    def _slot_tangent(self) -> np.ndarray:
+        """d slot / d scheduled_arrival for every patient."""
+        if self.appointment_times is None:
+            return np.arange(self.number_of_patients, dtype=np.float64)
+        return self.appointment_slots() / self.scheduled_arrival
+
+    def _cost_derivatives(self, result: dict[str, np.ndarray], service_tangents: np.ndarray) -> np.ndarray:
+        """
+        IPA derivatives of the cost components of every run (see _cost_components), as
+        (runs x parameters x components), from the start-time derivatives of the scheduling pass.
+
+        Each doctor is idle from 0 to the session end except while serving, so total idle time is
+        doctors * session end - total service; waiting is start - slot while positive; overtime is
+        each doctor's finish time past the working hours.
+        """
+        start = result["service_start_times"]
+        end = result["service_end_times"]
+        start_tangents = result["start_tangents"]
+        free_at = result["doctor_free_times"]
+        runs, n = start.shape
+        rows = np.arange(runs)
+        served = ~np.isnan(start)
+
+        # The session ends with the last departure (at 0, and fixed, without patients)
+        last = np.argmax(np.where(served, end, -np.inf), axis=1)
+        session_end_tangent = np.where(served.any(axis=1), start_tangents[:, rows, last] + service_tangents[:, rows, last], 0.0)
+        idle = self.doctors * session_end_tangent - np.where(served, service_tangents, 0.0).sum(axis=2)
+
+        slot_tangents = np.stack([self._slot_tangent(), np.zeros(n)])[:, None, :]
+        waiting_tangents = np.where(start > self.appointment_slots(), start_tangents - slot_tangents, 0.0)
+        waiting = np.nanmean(np.where(served, waiting_tangents, np.nan), axis=2) * n
+
+        overtime = np.where(free_at > self.working_hours * 60.0, result["free_tangents"], 0.0).sum(axis=2)
+        return np.stack([idle, waiting, overtime], axis=2).transpose(1, 0, 2)
+
+    def _store_batch(self, batch: dict[str, np.ndarray]) -> None:
+        """Append the runs of a batch returned by _run_batch() to the stored schedules."""
+        self.schedules.extend(batch)
+
+    def _run_metrics(self, schedules: ScheduleBatch) -> dict[str, np.ndarray]:
+        """
+        Per-run metrics of the given runs (waiting_times holds every served patient of every run).
+        Everything was computed in the scheduling pass, so this only reads and flattens arrays.
+        """
+        waiting_times = schedules.waiting_times.ravel()
+        return {
+            "idle_times": schedules.idle_times,
+            "waiting_times": waiting_times[~np.isnan(waiting_times)],
+            "overtime_times": schedules.overtime_times,
+            "queue_lengths": schedules.queue_lengths,
+            "doctor_utilizations": schedules.doctor_utilizations,
+            "session_times": schedules.session_times,
+        }
+
     def summary(self, print_summary: bool = False) -> Summary:
         """
         Returns:
             A Summary object containing various metrics from the simulation.
+            For streamed simulations (simulate(keep_schedules=False)) the metrics come from
+            the accumulator; the 95th percentile is then a sketch estimate within 0.5%.
 
         Args:
             print_summary: If True, prints a formatted summary to terminal
         """
-        idle_times: list[float] = []
-        waiting_times: list[float] = []
-        overtime_times: list[float] = []
-        queue_lengths: list[float] = []
-        schedules_dfs: list[pd.DataFrame] = []
-        doctor_utilizations: list[float] = []
-        total_session_time: list[float] = []
-
-        for schedule in self.schedules:
-            df = schedule.to_dataframe()
-            schedules_dfs.append(df)
-
-            markov_chain = schedule.to_markov_chain()
-            idle_times.append(markov_chain.get_server_idle_time())
-            waiting_times.extend(df['waiting_time'])
-            overtime_times.append(markov_chain.get_server_overtime(self.working_hours))
-            queue_lengths.append(markov_chain.get_average_queue_length())
-            doctor_utilizations.append(markov_chain.get_doctor_utilization())
-            total_session_time.append(markov_chain.total_time)
+        if self.accumulator is not None:
+            acc = self.accumulator
+            stats: dict[str, float] = {
+                "avg_waiting": acc.waiting_times.mean,
+                "max_waiting": acc.waiting_times.max,
+                "std_waiting": acc.waiting_times.std(),
+                "over_15": acc.waiting_times.count_above,
+                "pct_over_15": acc.waiting_times.count_above / acc.waiting_times.count * 100,
+                "p95_waiting": acc.waiting_sketch.percentile(95),
+                "utilization": acc.doctor_utilizations.mean,
+                "queue_length": acc.queue_lengths.mean,
+                "throughput": acc.throughputs.mean,
+                "idle": acc.idle_times.mean,
+                "overtime": acc.overtime_times.mean,
+            }
+        else:
+            metrics = self._run_metrics(self.schedules)
+            waiting_times = metrics["waiting_times"]
+            session_times = metrics["session_times"]
+            stats = self._weighted_stats(metrics) if self.tilt else {
+                "avg_waiting": np.mean(waiting_times),
+                "max_waiting": np.max(waiting_times),
+                "std_waiting": np.std(waiting_times),
+                "over_15": np.sum(waiting_times > 15) or 0,
+                "pct_over_15": np.mean(waiting_times > 15) * 100,
+                "p95_waiting": np.percentile(waiting_times, 95),
+                "utilization": np.mean(metrics["doctor_utilizations"]),
+                "queue_length": np.mean(metrics["queue_lengths"]),
+                "throughput": np.mean(self.number_of_patients / session_times[session_times > 0]),
+                "idle": np.mean(metrics["idle_times"]),
+                "overtime": np.mean(metrics["overtime_times"]),
+            }
 
         # Create a Summary object
         summary = Summary()
 
         patient_metrics = PatientMetrics()
 
-        patient_metrics.add_stats(Statistic("Avg Waiting Time", np.mean(waiting_times)))
-        patient_metrics.add_stats(Statistic("Max Waiting Time", np.max(waiting_times)))
-        patient_metrics.add_stats(Statistic("Std Waiting Time", np.std(waiting_times)))
-        patient_metrics.add_stats(Statistic("Patients Waiting Over 15Min", np.sum(np.array(waiting_times) > 15) or 0))
-        patient_metrics.add_stats(Statistic("Percentage Waiting Over 15Min", np.mean(np.array(waiting_times) > 15) * 100))
-        patient_metrics.add_stats(Statistic("Waiting Time 95th Percentile", np.percentile(waiting_times, 95)))
+        patient_metrics.add_stats(Statistic("Avg Waiting Time", stats["avg_waiting"]))
+        patient_metrics.add_stats(Statistic("Max Waiting Time", stats["max_waiting"]))
+        patient_metrics.add_stats(Statistic("Std Waiting Time", stats["std_waiting"]))
+        patient_metrics.add_stats(Statistic("Patients Waiting Over 15Min", stats["over_15"]))
+        patient_metrics.add_stats(Statistic("Percentage Waiting Over 15Min", stats["pct_over_15"]))
+        patient_metrics.add_stats(Statistic("Waiting Time 95th Percentile", stats["p95_waiting"]))
 
         summary.add_section(patient_metrics)
 
         system_metrics = SystemMetrics()
 
-        system_metrics.add_stats(Statistic("Doctor Utilization", np.mean(doctor_utilizations)))
-        system_metrics.add_stats(Statistic("Avg Queue Length", np.mean(queue_lengths)))
-        system_metrics.add_stats(Statistic("Throughput", np.mean([self.number_of_patients / total for total in total_session_time if total > 0])))
+        system_metrics.add_stats(Statistic("Doctor Utilization", stats["utilization"]))
+        system_metrics.add_stats(Statistic("Avg Queue Length", stats["queue_length"]))
+        system_metrics.add_stats(Statistic("Throughput", stats["throughput"]))
 
         summary.add_section(system_metrics)
 
+        importance_sampling = ImportanceSampling()
+
+        importance_sampling.add_stats(Statistic("Tilt", self.tilt))
+        importance_sampling.add_stats(Statistic("Effective Sample Size", self.effective_sample_size()))
+
+        summary.add_section(importance_sampling)
+
         average_costs = Averages()
 
-        self.cost = float(np.mean(idle_times) * self.cost_params[0] +
-                                np.mean(waiting_times) * self.number_of_patients * self.cost_params[1] +
-                                np.mean(overtime_times) * self.cost_params[2])
+        self.cost = float(stats["idle"] * self.cost_params[0] +
+                                stats["avg_waiting"] * self.number_of_patients * self.cost_params[1] +
+                                stats["overtime"] * self.cost_params[2])
 
-        average_costs.add_stats(Statistic("Avg Server Idle Time", np.mean(idle_times)))
-        average_costs.add_stats(Statistic("Avg Patient Waiting Time", np.mean(waiting_times)))
-        average_costs.add_stats(Statistic("Avg Server Overtime", np.mean(overtime_times)))
+        average_costs.add_stats(Statistic("Avg Server Idle Time", stats["idle"]))
+        average_costs.add_stats(Statistic("Avg Patient Waiting Time", stats["avg_waiting"]))
+        average_costs.add_stats(Statistic("Avg Server Overtime", stats["overtime"]))
         average_costs.add_stats(Statistic("Total Cost", self.cost))
 
         summary.add_section(average_costs)
 
-        schedules_section = Schedules()
-        schedules_section.extend(schedules_dfs)
+        # Lazy: run DataFrames are only built when accessed (none are kept for streamed runs)
+        schedules_section = Schedules(self.schedules if self.accumulator is None else None)
         summary.add_section(schedules_section)
 
         waiting_times_section = WaitingTimes()
-        waiting_times_section.extend(waiting_times)
+        if self.accumulator is not None:
+            waiting_times_section.sketch = self.accumulator.waiting_sketch
+        else:
+            waiting_times_section.extend(list(metrics["waiting_times"]))
+            if self.tilt:
+                waiting_times_section.weights = list(self._patient_weights())
         summary.add_section(waiting_times_section)
 
         self.summaries = summary
@@ -137,6 +699,47 @@ class Simulation:
 
         return summary
 
+    def _weighted_stats(self, metrics: dict[str, np.ndarray]) -> dict[str, float]:
+        """
+        The statistics of summary() for importance-sampled runs: every run, and every patient in it,
+        counts with the run's likelihood ratio (self-normalised, so the weights average to 1).
+        """
+        weights = self.schedules.likelihood_ratios
+        patient_weights = self._patient_weights()
+        waiting_times = metrics["waiting_times"]
+        session_times = metrics["session_times"]
+        has_session = session_times > 0
+        avg_waiting = np.average(waiting_times, weights=patient_weights)
+        share_over_15 = np.average(waiting_times > 15, weights=patient_weights)
+        return {
+            "avg_waiting": avg_waiting,
+            "max_waiting": np.max(waiting_times),
+            "std_waiting": np.sqrt(np.average((waiting_times - avg_waiting) ** 2, weights=patient_weights)),
+            "over_15": share_over_15 * len(waiting_times),
+            "pct_over_15": share_over_15 * 100,
+            "p95_waiting": weighted_percentile(waiting_times, patient_weights, 95),
+            "utilization": np.average(metrics["doctor_utilizations"], weights=weights),
+            "queue_length": np.average(metrics["queue_lengths"], weights=weights),
+            "throughput": np.average(self.number_of_patients / session_times[has_session], weights=weights[has_session]),
+            "idle": np.average(metrics["idle_times"], weights=weights),
+            "overtime": np.average(metrics["overtime_times"], weights=weights),
+        }
+
+    def _patient_weights(self) -> np.ndarray:
+        """Likelihood ratio of every served patient's run, flattened and filtered like _run_metrics()["waiting_times"]."""
+        waiting = self.schedules.waiting_times
+        return np.repeat(self.schedules.likelihood_ratios, waiting.shape[1])[~np.isnan(waiting.ravel())]
+
+    def effective_sample_size(self) -> float:
+        """
+        Kish effective sample size of the likelihood-ratio weights, (sum w)^2 / sum w^2: the number of
+        nominal runs the weighted estimates are worth. Equals the number of runs without importance sampling.
+        """
+        if self.accumulator is not None:
+            return float(self.accumulator.runs)
+        weights = self.schedules.likelihood_ratios
+        return float(weights.sum() ** 2 / (weights ** 2).sum()) if len(weights) else 0.0
+
     def _print_summary(self) -> None:
         """Print formatted summary to terminal"""
         print("\n" + "="*80)
@@ -150,7 +753,7 @@ class Simulation:
         s = self.summaries
 
         print(f"\nSimulation Parameters:")
-        print(f"  Number of runs: {len(self.schedules)}")
+        print(f"  Number of runs: {self.accumulator.runs if self.accumulator is not None else len(self.schedules)}")
         print(f"  Working hours: {self.working_hours} hours")
         print(f"  Mean service time: {self.mean_service_time} minutes")
         print(f"  Number of doctors: {self.doctors}")
@@ -173,6 +776,11 @@ class Simulation:
 
         print(f"\nTotal Cost: ${s['averages']['total_cost']:.2f}")
 
+        if self.tilt:
+            print(f"\nImportance Sampling (estimates weighted by likelihood ratios):")
+            print(f"  Tilt: {s['importance_sampling']['tilt']:.4f}")
+            print(f"  Effective sample size: {s['importance_sampling']['effective_sample_size']:.1f}")
+
         # Print control variate information if available
         if self.control_variate_info:
             cv_info = self.control_variate_info
@@ -202,6 +810,205 @@ class Simulation:
             self.summary()
         return self.summaries["averages"]["total_cost"]
 
+    def run_costs(self) -> np.ndarray:
+        """
+        Total cost of every stored run (idle, average waiting per patient and overtime priced
+        with cost_params). Their mean is the total cost of summary() when no patient is dropped.
+        """
+        return self._costs(self._stored_runs())
+
+    @property
+    def replication_runs(self) -> int:
+        """
+        Runs per independent replication: RQMC_POINTS with rqmc sampling (one randomized point set),
+        2 with antithetic sampling (a pair), else 1. Run counts must be multiples of it.
+        """
+        if self.sampling == "rqmc":
+            return self.RQMC_POINTS
+        return 2 if self.antithetic else 1
+
+    def whole_replications(self, number_of_runs: int) -> int:
+        """number_of_runs rounded up to a multiple of replication_runs, as simulate() accepts it."""
+        return -(-number_of_runs // self.replication_runs) * self.replication_runs
+
+    def replications(self, values: np.ndarray) -> np.ndarray:
+        """
+        Per-run values (along the first axis) as independent replications, for variances and
+        confidence intervals: the means over replication_runs consecutive runs.
+        """
+        return replication_means(values, self.replication_runs) if self.replication_runs > 1 else values
+
+    def run_cost_components(self) -> np.ndarray:
+        """
+        (runs x 3) unpriced cost components of every stored run: idle time, waiting time
+        (average per patient times number_of_patients) and overtime. run_costs() is this times cost_params.
+        """
+        return self._cost_components(self._stored_runs())
+
+    def run_cost_derivatives(self) -> np.ndarray:
+        """
+        (runs x 2 x 3) IPA derivatives of run_cost_components() with respect to scheduled_arrival
+        and mean_service_time (axes as ScheduleBatch.DERIVATIVE_PARAMETERS and COST_COMPONENTS).
+        """
+        return self._stored_runs().cost_derivatives
+
+    def run_control_variables(self) -> np.ndarray:
+        """
+        (runs x 3) control variables of every stored run: mean service time, mean unpunctuality
+        and total service time (columns as ScheduleBatch.CONTROL_VARIABLES).
+        """
+        return self._stored_runs().control_variables
+
+    def run_slot_service_sums(self) -> np.ndarray:
+        """
+        (runs x ScheduleBatch.SERVICE_BLOCKS) total service time of the patients booked in each
+        block of consecutive appointments, for every stored run.
+        """
+        return self._stored_runs().slot_service_sums
+
+    def cost_gradient(self, confidence: float = 0.95) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        Local slopes of the expected cost components and total cost with respect to
+        scheduled_arrival and mean_service_time, with confidence intervals.
+
+        Sample-path (IPA) derivatives are recorded for every run in the scheduling pass: a start
+        time moves with the arrival that opened its busy period plus the services since, so no
+        extra runs are simulated. Their mean is an unbiased slope estimate because every cost
+        component is continuous and piecewise linear in the parameters along each run.
+        Unpunctuality clipped at TruncatedNormal.LOWER_BOUND is an atom, though: where a slot
+        equals -LOWER_BOUND (slot 2 at 15 minute slots) those patients arrive exactly at 0, the
+        expected cost has a kink, and the slope is the one for a shorter scheduled_arrival.
+        For mean_service_time the number of patients is held at number_of_patients, i.e. this is
+        the slope between the steps where int(working_hours * 60 // mean) changes.
+        With a finite queue_capacity, patients dropped or admitted after a small change make
+        the costs jump, which IPA does not see: the slopes are then biased when drops are common.
+        With antithetic or rqmc sampling the intervals come from the replication means.
+
+        Returns parameter -> metric (idle_time, waiting_time, overtime, total_cost) ->
+        {"slope", "half_width"}.
+        """
+        derivatives = self.run_cost_derivatives()
+        if not len(derivatives) or np.isnan(derivatives).any():
+            raise RuntimeError("No derivatives recorded for the stored runs. Run simulate() first.")
+        derivatives = self.replications(derivatives)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        total = derivatives @ np.asarray(self.cost_params, dtype=np.float64)
+        gradient: dict[str, dict[str, dict[str, float]]] = {}
+        for p, parameter in enumerate(ScheduleBatch.DERIVATIVE_PARAMETERS):
+            values = {name: derivatives[:, p, c] for c, name in enumerate(ScheduleBatch.COST_COMPONENTS)}
+            values["total_cost"] = total[:, p]
+            gradient[parameter] = {
+                name: {
+                    "slope": float(v.mean()),
+                    "half_width": float(z * v.std(ddof=1) / math.sqrt(len(v))) if len(v) > 1 else float('inf'),
+                }
+                for name, v in values.items()
+            }
+        return gradient
+
+    def tail_probability(self, event: str = "overtime", level: float | None = None,
+                         confidence: float = 0.95) -> dict[str, float]:
+        """
+        Probability of a rare event per run, from the stored runs weighted by their likelihood ratios.
+
+        Events (see TAIL_EVENTS for the default levels):
+        - "overtime": the last patient leaves more than level minutes after working hours
+        - "long_wait": some patient waits more than level minutes past the appointment
+
+        The estimate is the mean of w * 1{event} over the runs, unbiased for the nominal
+        probability; with a tilt from choose_tilt() the event is common among the runs and the
+        interval is far narrower than from the same number of nominal runs.
+
+        Returns the probability, the half width and relative half width of its confidence interval,
+        the number of runs with the event and the effective sample size.
+        """
+        if self.accumulator is not None or not len(self.schedules):
+            raise RuntimeError("Tail probabilities need stored runs; simulate with keep_schedules=True.")
+        level = self._tail_level(event, level)
+        hits = self._tail_scores(self.schedules, event) > level
+        weighted = self.replications(self.schedules.likelihood_ratios * hits)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        probability = float(weighted.mean())
+        half_width = float(z * weighted.std(ddof=1) / math.sqrt(len(weighted))) if len(weighted) > 1 else float('inf')
+        return {
+            "probability": probability,
+            "half_width": half_width,
+            "rel_half_width": half_width / probability if probability else float('inf'),
+            "hits": int(hits.sum()),
+            "effective_sample_size": self.effective_sample_size(),
+        }
+
+    def choose_tilt(self, event: str = "overtime", level: float | None = None, pilot_runs: int = 1000,
+                    rarity: float = 0.1, max_iterations: int = 10) -> float:
+        """
+        Tilt for importance sampling of an event of tail_probability(), chosen by the cross-entropy
+        method on pilot runs.
+
+        The tilt shifts the standard normals behind every draw, i.e. the log service times by
+        tilt * sigma; unpunctuality comes from the same normals and shifts with them. Each iteration
+        simulates pilot_runs runs at the current tilt, keeps the runs whose score reaches the
+        (1 - rarity) quantile (or level, once the quantile gets there) and moves the tilt to their
+        likelihood-weighted mean normal: the shift closest in cross entropy to the draws given the
+        event. It stops after the first iteration at level. Pilot runs use their own seeds
+        (PILOT_SEED_OFFSET) and are discarded.
+
+        Returns the tilt, to be used as Simulation(..., tilt=tilt).
+        """
+        level = self._tail_level(event, level)
+        tilt = 0.0
+        for iteration in range(max_iterations):
+            seed = None if self.seed is None else self.seed + self.PILOT_SEED_OFFSET + iteration * pilot_runs
+            pilot = Simulation(**{**self._config(), "seed": seed, "sampling": "batch", "antithetic": False, "tilt": tilt})
+            service_times, interarrival_deviation = pilot._draw(pilot._streams(pilot_runs, spawn=False))
+            runs = pilot._new_schedule_batch()
+            runs.extend(pilot._schedule_batch(service_times, interarrival_deviation))
+
+            scores = self._tail_scores(runs, event)
+            threshold = min(level, float(np.quantile(scores, 1 - rarity)))
+            elite = scores > level if threshold >= level else scores >= threshold
+            if not elite.any():
+                break
+            normal_means = (np.log(service_times) - pilot.service_distribution.mu).mean(axis=1) / pilot.service_distribution.sigma
+            tilt = float(np.average(normal_means[elite], weights=runs.likelihood_ratios[elite]))
+            if threshold >= level:
+                break
+        return tilt
+
+    def _tail_level(self, event: str, level: float | None) -> float:
+        if event not in self.TAIL_EVENTS:
+            raise ValueError(f"Unknown event '{event}'. Choose from {list(self.TAIL_EVENTS)}.")
+        return self.TAIL_EVENTS[event] if level is None else level
+
+    def _tail_scores(self, runs: ScheduleBatch, event: str) -> np.ndarray:
+        """Per-run score of a tail event, which happens when the score exceeds the level."""
+        if event == "overtime":
+            # minutes the session runs past working hours (negative if it ends early)
+            return runs.session_times - self.working_hours * 60.0
+        # longest wait of a served patient
+        return np.nanmax(runs.waiting_times, axis=1)
+
+    def _stored_runs(self) -> ScheduleBatch:
+        self._require_unweighted()
+        if self.accumulator is not None:
+            raise RuntimeError("Per-run costs need stored schedules; simulate with keep_schedules=True.")
+        return self.schedules
+
+    def _require_unweighted(self) -> None:
+        if self.tilt:
+            raise RuntimeError("Per-run values of importance-sampled runs need their likelihood ratios; "
+                               "use summary() or tail_probability(), or simulate with tilt=0.")
+
+    def _cost_components(self, runs: ScheduleBatch) -> np.ndarray:
+        return np.column_stack([
+            runs.idle_times,
+            np.nanmean(runs.waiting_times, axis=1) * self.number_of_patients,
+            runs.overtime_times,
+        ])
+
+    def _costs(self, runs: ScheduleBatch) -> np.ndarray:
+        idle, waiting, overtime = self._cost_components(runs).T
+        return idle * self.cost_params[0] + waiting * self.cost_params[1] + overtime * self.cost_params[2]
+
     def _total_cost(self) -> float:
         """
         Return the total cost of the simulation.
@@ -231,11 +1038,16 @@ class Simulation:
 
     def write_summaries_to_sqlite(self, filepath: str) -> None:
         """
-        Write schedules as separate tables to a single SQLite DB.
-        Tables: schedule_run_1, schedule_run_2, ..., and 'averages' for summary metrics.
+        Write the summary and schedules to a single SQLite DB.
+        Tables: 'averages', 'patient_metrics', 'system_metrics' for summary metrics, and
+        'schedules' with every run's schedule in long format (run_id column, 0-based).
         """
         summaries = self.summaries
-        filename = f"{filepath}/{str(self).replace('/', '_')}.db"
+        name = str(self)
+        if self.scheduled_arrival != int(self.scheduled_arrival):
+            # :g rounds to 6 digits; the shortest exact repr keeps nearby candidates in their own files
+            name = f"{float(self.scheduled_arrival)!r}/{float(self.mean_service_time)}/{int(self.doctors)}"
+        filename = f"{filepath}/{name.replace('/', '_')}.db"
         # Ensure directory exists
         dirpath = os.path.dirname(filename)
         if dirpath and not os.path.exists(dirpath):
@@ -251,10 +1063,10 @@ class Simulation:
             summaries.system_metrics.to_dataframe().round(6).to_sql(
                 "system_metrics", conn, index=False, if_exists="replace"
             )
-            # write each schedule as its own table
-            for i, df in tqdm(enumerate(summaries.schedules.arr, start=1)):
-                tbl = f"schedule_run_{i}"
-                df.round(6).to_sql(tbl, conn, index=False, if_exists="replace")
+            # all schedules in one table, written in one go
+            summaries.schedules.to_long_dataframe().round(6).to_sql(
+                "schedules", conn, index=False, if_exists="replace"
+            )
         finally:
             conn.close()
             print(f"{filename} written successfully.")
@@ -262,7 +1074,7 @@ class Simulation:
     def estimate_sqlite_size_quick(self) -> int:
         """
         Quick approximate estimate (bytes) of the SQLite DB that write_summaries_to_sqlite would produce.
-        Uses DataFrame.memory_usage(deep=True) plus small overheads for schema and per-row storage.
+        Uses the in-memory size of the schedules table plus small overheads for schema and per-row storage.
         NOTE: approximate — actual SQLite file size can differ (pages, indices, encoding).
         """
         if not hasattr(self, "summaries"):
@@ -275,20 +1087,11 @@ class Simulation:
             # rough: each key and value as text, estimate len of repr
             total_bytes += sum(len(str(k)) + len(str(v)) for k, v in d.items())
 
-        # schedules: sum pandas memory usage
-        for df in self.summaries.schedules.arr:
-            try:
-                total_bytes += int(df.memory_usage(deep=True).sum())
-            except Exception:
-                # fallback for unexpected df-like: convert to CSV size approximation
-                try:
-                    csv_bytes = df.to_csv(index=False).encode("utf-8")
-                    total_bytes += len(csv_bytes)
-                except Exception:
-                    total_bytes += 1024  # fallback small buffer
-
-            # add per-table SQLite overhead (schema, pages): add 1 KB + 50 bytes per row
-            total_bytes += 1024 + 50 * len(df)
+        # schedules: one long table, sized from the run arrays without building the DataFrame
+        schedules = self.summaries.schedules
+        total_bytes += schedules.memory_usage()
+        # add table SQLite overhead (schema, pages): add 1 KB + 50 bytes per row
+        total_bytes += 1024 + 50 * schedules.rows()
 
         # Add small overhead for SQLite file header / metadata
         total_bytes += 4096
@@ -331,9 +1134,9 @@ class Simulation:
         """
         service_times = self.service_distribution.sample(size=self.number_of_patients, seed=seed)
         interarrival_deviation = self.iat_distribution.sample(size=self.number_of_patients, seed=seed)
-        arrival_times = [i * self.scheduled_arrival + dev for i, dev in enumerate(interarrival_deviation)]
+        arrival_times = [slot + dev for slot, dev in zip(self.appointment_slots(), interarrival_deviation)]
 
-        schedule = Schedule(self.working_hours, self.scheduled_arrival)
+        schedule = Schedule(self.working_hours, self.scheduled_arrival, self.appointment_times)
         schedule.setup_schedule(
             arrival_times,
             service_times,
@@ -588,23 +1391,21 @@ class Simulation:
         return comparison
 
     def calculate_theoretical_unpunctuality_mean(self) -> float:
-        """Calculate theoretical mean of truncated normal unpunctuality distribution"""
-        mu = self.iat_distribution.mu
-        sigma = self.iat_distribution.sigma
-        lower = self.iat_distribution.LOWER_BOUND
-        upper = self.iat_distribution.UPPER_BOUND
-
-        a = (lower - mu) / sigma
-        b = (upper - mu) / sigma
-        return truncnorm.mean(a, b, loc=mu, scale=sigma)
+        """
+        Theoretical mean of the simulated unpunctuality: the samples are clipped to the bounds, not
+        truncated, so this is TruncatedNormal.clipped_mean() rather than the truncnorm mean
+        """
+        return self.iat_distribution.clipped_mean()
 
     def comprehensive_control_variate_comparison(self, num_runs: int = 1000, base_seed: int | None = None) -> dict[str, Any]:
         """
         Comprehensive control variate comparison for waiting time, idle time, overtime, and total cost
-        """
-        if base_seed is None:
-            base_seed = self.seed if self.seed is not None else 42
 
+        Works on the first num_runs stored runs and the control variables recorded when they
+        were simulated (see run_control_variables), so no run is simulated twice. If base_seed
+        is given, or fewer runs are stored, num_runs runs with per-run seeds base_seed + i are
+        scheduled for the comparison instead.
+        """
         print(f"\n{'='*80}")
         print(f"COMPREHENSIVE CONTROL VARIATE ANALYSIS")
         print(f"{'='*80}")
@@ -619,169 +1420,71 @@ class Simulation:
         theoretical_mean_unpunctuality = self.calculate_theoretical_unpunctuality_mean()
         theoretical_mean_total_service = self.number_of_patients * self.mean_service_time
 
-        # Storage for results
-        standard_results: dict[str, list[Any]] = {
-            'waiting': [], 'idle': [], 'overtime': [], 'cost': []
-        }
-        cv_results: dict[str, list[Any]] = {
-            'waiting': [], 'idle': [], 'overtime': [], 'cost': []
-        }
-
-        # Store control variables for coefficient calculation
-        control_vars: dict[str, list[Any]] = {
-            'mean_service': [],
-            'avg_unpunctuality': [],
-            'total_service': []
+        # Standard metrics (without control variates) and control variables of every run
+        runs = self._control_variate_runs(num_runs, base_seed)
+        components, control_vars = runs["cost_components"], runs["control_variables"]
+        replications = len(components)  # see replications()
+        idle_time, total_waiting, overtime = components.T
+        standard_results: dict[str, np.ndarray] = {
+            'waiting': total_waiting / self.number_of_patients,
+            'idle': idle_time,
+            'overtime': overtime,
+            'cost': components @ np.asarray(self.cost_params, dtype=np.float64),
         }
-
-        print(f"\nRunning simulations...")
-        for run in tqdm(range(num_runs), desc="Control Variate Analysis"):
-            seed = base_seed + run
-
-            # Run single simulation
-            service_times = self.service_distribution.sample(size=self.number_of_patients, seed=seed)
-            interarrival_deviation = self.iat_distribution.sample(size=self.number_of_patients, seed=seed)
-            arrival_times = [i * self.scheduled_arrival + dev for i, dev in enumerate(interarrival_deviation)]
-
-            schedule = Schedule(self.working_hours, self.scheduled_arrival)
-            schedule.setup_schedule(arrival_times, service_times, servers=self.doctors, queue_capacity=self.queue_capacity)
-
-            df = schedule.to_dataframe()
-            markov_chain = schedule.to_markov_chain()
-
-            # Extract metrics
-            waiting_times = df['waiting_time'].values
-            idle_time = markov_chain.get_server_idle_time()
-            overtime = markov_chain.get_server_overtime(self.working_hours)
-
-            # Standard metrics (without control variates)
-            mean_waiting = float(np.mean(waiting_times))
-            standard_results['waiting'].append(mean_waiting)
-            standard_results['idle'].append(idle_time)
-            standard_results['overtime'].append(overtime)
-
-            # Calculate standard cost
-            standard_cost: float = (
-                idle_time * self.cost_params[0] +
-                mean_waiting * self.number_of_patients * self.cost_params[1] +
-                overtime * self.cost_params[2]
-            )
-            standard_results['cost'].append(standard_cost)
-
-            # Store control variables
-            mean_service = float(np.mean(service_times))
-            avg_unpunctuality = float(np.mean(interarrival_deviation))
-            total_service = float(np.sum(service_times))
-
-            control_vars['mean_service'].append(mean_service)
-            control_vars['avg_unpunctuality'].append(avg_unpunctuality)
-            control_vars['total_service'].append(total_service)
+        # Control variable of every metric: mean service, mean unpunctuality, total service
+        controls = dict(zip(('waiting', 'idle', 'overtime'), control_vars.T))
+        control_means = dict(zip(('waiting', 'idle', 'overtime'),
+                                 (theoretical_mean_service, theoretical_mean_unpunctuality, theoretical_mean_total_service)))
 
         # TWO-STAGE APPROACH FOR ALL METRICS
         # Stage 1: Use pilot runs to estimate coefficients (first 20% of runs)
         # Stage 2: Apply coefficients to remaining runs (last 80% of runs)
         # This eliminates data snooping bias by using independent data for estimation and application
-        pilot_size = max(int(num_runs * 0.2), 100)  # At least 100 pilot runs
+        pilot_size = max(int(replications * 0.2), 100)  # At least 100 pilot runs
+        unit = "runs" if self.replication_runs == 1 else f"replications of {self.replication_runs} runs"
         print(f"\nUsing two-stage approach for all control variates:")
-        print(f"  Pilot runs: {pilot_size} (for estimating coefficients)")
-        print(f"  Main runs:  {num_runs - pilot_size} (for applying coefficients)")
+        print(f"  Pilot {unit}: {pilot_size} (for estimating coefficients)")
+        print(f"  Main {unit}:  {replications - pilot_size} (for applying coefficients)")
 
         # Calculate optimal coefficients from PILOT runs only
         print("\nCalculating optimal control variate coefficients from pilot runs...")
-
-        # Waiting time coefficient (TWO-STAGE: use only pilot runs)
-        pilot_waiting = standard_results['waiting'][:pilot_size]
-        pilot_service = control_vars['mean_service'][:pilot_size]
-        cov_waiting_service = np.cov(pilot_waiting, pilot_service)[0, 1]
-        var_service = np.var(pilot_service, ddof=1)
-        c_waiting = -cov_waiting_service / var_service if var_service > 0 else 0
-        pilot_mean_service = np.mean(pilot_service)
-
-        # Idle time coefficient (TWO-STAGE: use only pilot runs)
-        pilot_idle = standard_results['idle'][:pilot_size]
-        pilot_unpunc = control_vars['avg_unpunctuality'][:pilot_size]
-        cov_idle_unpunc = np.cov(pilot_idle, pilot_unpunc)[0, 1]
-        var_unpunc = np.var(pilot_unpunc, ddof=1)
-        c_idle = -cov_idle_unpunc / var_unpunc if var_unpunc > 0 else 0
-        pilot_mean_unpunc = np.mean(pilot_unpunc)
-
-        # Overtime coefficient (TWO-STAGE: use only pilot runs)
-        pilot_overtime = standard_results['overtime'][:pilot_size]
-        pilot_total_service = control_vars['total_service'][:pilot_size]
-        cov_overtime_total = np.cov(pilot_overtime, pilot_total_service)[0, 1]
-        var_total = np.var(pilot_total_service, ddof=1)
-        c_overtime = -cov_overtime_total / var_total if var_total > 0 else 0
-        pilot_mean_total_service = np.mean(pilot_total_service)
+        # Pilot runs are NOT adjusted (used for coefficient estimation),
+        # main runs ARE adjusted (using coefficients from pilot runs)
+        coefficients: dict[str, float] = {}
+        cv_results: dict[str, np.ndarray] = {}
+        for metric, control in controls.items():
+            pilot_metric = standard_results[metric][:pilot_size]
+            pilot_control = control[:pilot_size]
+            var_control = np.var(pilot_control, ddof=1)
+            coefficients[metric] = -np.cov(pilot_metric, pilot_control)[0, 1] / var_control if var_control > 0 else 0
+            cv_results[metric] = standard_results[metric].copy()
+            cv_results[metric][pilot_size:] += coefficients[metric] * (control[pilot_size:] - control_means[metric])
 
         print(f"  Optimal coefficients (from pilot runs):")
-        print(f"    Waiting time (c*): {c_waiting:.6f}")
-        print(f"    Idle time (c*):    {c_idle:.6f}")
-        print(f"    Overtime (c*):     {c_overtime:.6f}")
-
-        # Apply control variates with optimal coefficients
-        # TWO-STAGE: Pilot runs are NOT adjusted (used for coefficient estimation)
-        #            Main runs ARE adjusted (using coefficients from pilot runs)
-        for i in range(num_runs):
-            # 1. Waiting time control (TWO-STAGE)
-            if i < pilot_size:
-                cv_mean_waiting = standard_results['waiting'][i]
-            else:
-                cv_mean_waiting = standard_results['waiting'][i] + c_waiting * (
-                    control_vars['mean_service'][i] - pilot_mean_service
-                )
-            cv_results['waiting'].append(cv_mean_waiting)
-
-            # 2. Idle time control (TWO-STAGE)
-            if i < pilot_size:
-                cv_idle = standard_results['idle'][i]
-            else:
-                cv_idle = standard_results['idle'][i] + c_idle * (
-                    control_vars['avg_unpunctuality'][i] - pilot_mean_unpunc
-                )
-            cv_results['idle'].append(cv_idle)
-
-            # 3. Overtime control (TWO-STAGE)
-            if i < pilot_size:
-                cv_overtime = standard_results['overtime'][i]
-            else:
-                cv_overtime = standard_results['overtime'][i] + c_overtime * (
-                    control_vars['total_service'][i] - pilot_mean_total_service
-                )
-            cv_results['overtime'].append(cv_overtime)
-
-            # Calculate CV cost
-            cv_cost = (
-                cv_idle * self.cost_params[0] +
-                cv_mean_waiting * self.number_of_patients * self.cost_params[1] +
-                cv_overtime * self.cost_params[2]
-            )
-            cv_results['cost'].append(cv_cost)
+        print(f"    Waiting time (c*): {coefficients['waiting']:.6f}")
+        print(f"    Idle time (c*):    {coefficients['idle']:.6f}")
+        print(f"    Overtime (c*):     {coefficients['overtime']:.6f}")
+
+        # Calculate CV cost
+        cv_results['cost'] = (
+            cv_results['idle'] * self.cost_params[0] +
+            cv_results['waiting'] * self.number_of_patients * self.cost_params[1] +
+            cv_results['overtime'] * self.cost_params[2]
+        )
 
         # Calculate statistics
         # For all metrics using two-stage approach, only use MAIN runs (pilot runs don't have CV applied)
         comparison: dict[str, Any] = {
             'num_runs': num_runs,
             'pilot_size': pilot_size,
-            'waiting': self._calculate_metric_comparison(
-                standard_results['waiting'][pilot_size:],
-                cv_results['waiting'][pilot_size:],
-                num_runs - pilot_size
-            ),
-            'idle': self._calculate_metric_comparison(
-                standard_results['idle'][pilot_size:],
-                cv_results['idle'][pilot_size:],
-                num_runs - pilot_size
-            ),
-            'overtime': self._calculate_metric_comparison(
-                standard_results['overtime'][pilot_size:],
-                cv_results['overtime'][pilot_size:],
-                num_runs - pilot_size
-            ),
-            'cost': self._calculate_metric_comparison(
-                standard_results['cost'][pilot_size:],
-                cv_results['cost'][pilot_size:],
-                num_runs - pilot_size
-            )
+            **{
+                metric: self._calculate_metric_comparison(
+                    standard_results[metric][pilot_size:],
+                    cv_results[metric][pilot_size:],
+                    replications - pilot_size
+                )
+                for metric in ('waiting', 'idle', 'overtime', 'cost')
+            }
         }
 
         # Store for summary display
@@ -799,7 +1502,105 @@ class Simulation:
 
         return comparison
 
-    def _calculate_metric_comparison(self, standard: list[float], cv: list[float], num_runs: int) -> dict[str, Any]:
+    def regression_control_variate_comparison(self, num_runs: int = 1000, base_seed: int | None = None,
+                                              slot_controls: bool = True,
+                                              extra_controls: dict[str, tuple[np.ndarray, float]] | None = None) -> dict[str, Any]:
+        """
+        Control variate comparison that regresses all metrics (waiting, idle, overtime, cost) on
+        all controls at once, instead of pairing each metric with one control.
+
+        Controls are the mean unpunctuality and the total service time of a run, or, with
+        slot_controls, the service time summed per block of appointments (ScheduleBatch.SERVICE_BLOCKS),
+        which also tells when in the day the long services fell. extra_controls adds
+        name -> (value of each of the num_runs runs, known mean). As in the comprehensive comparison,
+        coefficients come from the pilot runs and are applied to the main runs only, and antithetic
+        pairs or rqmc point sets count as one replication; controls are centred on their known means. Runs are chosen as in comprehensive_control_variate_comparison.
+
+        Returns the per-metric comparison (as comprehensive_control_variate_comparison), the
+        coefficients of every metric per control and the pilot size.
+        """
+        runs = self._control_variate_runs(num_runs, base_seed)
+        mean_service = self.service_distribution.mean()
+        controls: dict[str, tuple[np.ndarray, float]] = {
+            # samples are clipped to the bounds, so their mean is not the truncated normal's
+            "mean_unpunctuality": (runs["control_variables"][:, 1], self.calculate_theoretical_unpunctuality_mean()),
+        }
+        if slot_controls:
+            for block, (first, last) in enumerate(self._service_blocks()):
+                controls[f"service_block_{block + 1}"] = (runs["slot_service_sums"][:, block], (last - first) * mean_service)
+        else:
+            controls["total_service"] = (runs["control_variables"][:, 2], self.number_of_patients * mean_service)
+        for name, (values, mean) in (extra_controls or {}).items():
+            values = np.asarray(values, dtype=np.float64)
+            if values.shape != (num_runs,):
+                raise ValueError(f"Extra control '{name}' needs one value per run ({num_runs}), got shape {values.shape}.")
+            controls[name] = (self.replications(values), mean)
+
+        metrics = ('waiting', 'idle', 'overtime', 'cost')
+        components = runs["cost_components"]
+        # (runs x metrics) responses and (runs x controls) controls centred on their known means
+        responses = np.column_stack([
+            components[:, 1] / self.number_of_patients, components[:, 0], components[:, 2],
+            components @ np.asarray(self.cost_params, dtype=np.float64),
+        ])
+        deviations = np.column_stack([values - mean for values, mean in controls.values()])
+
+        # Two-stage: least squares coefficients of every metric from the pilot runs, applied to the main runs
+        replications = len(responses)  # see replications()
+        pilot_size = max(int(replications * 0.2), 100)  # At least 100 pilot runs
+        pilot_x = deviations[:pilot_size] - deviations[:pilot_size].mean(axis=0)
+        pilot_y = responses[:pilot_size] - responses[:pilot_size].mean(axis=0)
+        coefficients = np.linalg.lstsq(pilot_x, pilot_y, rcond=None)[0]  # (controls x metrics)
+        adjusted = responses[pilot_size:] - deviations[pilot_size:] @ coefficients
+
+        regression: dict[str, Any] = {
+            'num_runs': num_runs,
+            'pilot_size': pilot_size,
+            'controls': list(controls),
+            'coefficients': {
+                metric: dict(zip(controls, coefficients[:, m].tolist())) for m, metric in enumerate(metrics)
+            },
+            **{
+                metric: self._calculate_metric_comparison(responses[pilot_size:, m], adjusted[:, m], replications - pilot_size)
+                for m, metric in enumerate(metrics)
+            }
+        }
+        self.control_variate_info['regression'] = regression
+        self._print_regression_cv_results(regression)
+        return regression
+
+    def _control_variate_runs(self, num_runs: int, base_seed: int | None) -> dict[str, np.ndarray]:
+        """
+        Per-replication arrays of the runs compared by the control variate comparisons: (runs x 3)
+        cost components, control variables and slot service sums of the first num_runs stored runs
+        if there are enough (with recorded controls) and no base_seed is given, else of fresh runs.
+        With antithetic or rqmc sampling these are replication means (see replications).
+        """
+        self._require_unweighted()
+        if base_seed is None and self.accumulator is None and len(self.schedules) >= num_runs:
+            runs = self.schedules
+            if not np.isnan(runs.control_variables[:num_runs]).any():
+                print(f"\nUsing the {num_runs} runs already simulated...")
+                return {
+                    "cost_components": self.replications(self._cost_components(runs)[:num_runs]),
+                    "control_variables": self.replications(runs.control_variables[:num_runs]),
+                    "slot_service_sums": self.replications(runs.slot_service_sums[:num_runs]),
+                }
+
+        if base_seed is None:
+            base_seed = self.seed if self.seed is not None else 42
+        print(f"\nRunning simulations...")
+        # Per-replication seeds base_seed + i, scheduled for all runs at once by the batch kernels
+        per_seed = self.replication_runs
+        runs = self._new_schedule_batch()
+        runs.extend(self._schedule_batch(*self._draw([(per_seed, base_seed + i) for i in range(num_runs // per_seed)])))
+        return {
+            "cost_components": self.replications(self._cost_components(runs)),
+            "control_variables": self.replications(runs.control_variables),
+            "slot_service_sums": self.replications(runs.slot_service_sums),
+        }
+
+    def _calculate_metric_comparison(self, standard: np.ndarray, cv: np.ndarray, num_runs: int) -> dict[str, Any]:
         """Helper to calculate comparison statistics for a metric"""
         standard_arr = np.array(standard)
         cv_arr = np.array(cv)
@@ -854,6 +1655,21 @@ class Simulation:
 
         print(f"\n{'='*80}\n")
 
+    def _print_regression_cv_results(self, regression: dict[str, Any]) -> None:
+        """Print the regression control variate results, one line per metric"""
+        print(f"\n{'='*80}")
+        print("REGRESSION CONTROL VARIATE RESULTS")
+        print(f"{'='*80}")
+        print(f"Controls: {', '.join(regression['controls'])}")
+        print(f"[Two-stage approach: {regression['pilot_size']} pilot runs + {regression['num_runs'] - regression['pilot_size']} main runs]")
+        print(f"\n  {'Metric':<10} {'MC mean':>12} {'CV mean':>12} {'MC std err':>12} {'CV std err':>12} {'Reduction':>10} {'Gain':>8}")
+        for key in ('waiting', 'idle', 'overtime', 'cost'):
+            data = regression[key]
+            print(f"  {key:<10} {data['standard']['mean']:>12.4f} {data['cv']['mean']:>12.4f} "
+                  f"{data['standard']['std_error']:>12.4f} {data['cv']['std_error']:>12.4f} "
+                  f"{data['variance_reduction_percent']:>9.2f}% {data['efficiency_gain']:>7.2f}x")
+        print(f"\n{'='*80}\n")
+
     def __getitem__(self, key: str) -> Any:
         """
         Allow dict-like access to attributes.
@@ -869,8 +1685,9 @@ class Simulation:
         setattr(self, key, value)
     
     def __str__(self) -> str:
-        # Use notation of queueing systems (e.g., M/M/1)
-        return (f"{int(self.scheduled_arrival)}/{float(self.mean_service_time)}/{int(self.doctors)}")
+        # Use notation of queueing systems (e.g., M/M/1); :g keeps the continuous candidates of
+        # golden-section search apart (15.29 and 15.66, not 15 twice) and prints whole minutes as before
+        return (f"{self.scheduled_arrival:g}/{float(self.mean_service_time)}/{int(self.doctors)}")
     
     def __repr__(self) -> str:
         # Same as __str__
@@ -888,5 +1705,11 @@ class Simulation:
                 self.iat_distribution == other.iat_distribution and
                 self.service_distribution == other.service_distribution and
                 self.cost_params == other.cost_params and
-                self.seed == other.seed)
+                self.seed == other.seed and
+                self.sampling == other.sampling and
+                self.antithetic == other.antithetic and
+                self.tilt == other.tilt and
+                ((self.appointment_times is None and other.appointment_times is None) or
+                 (self.appointment_times is not None and other.appointment_times is not None and
+                  np.array_equal(self.appointment_times, other.appointment_times))))
 
@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from distribution import Lognormal, TruncatedNormal
+from simulation import Simulation
+
+@pytest.fixture
+def clinic():
+    """Factory for a small seeded clinic (32 patients, 15 minute slots); keyword arguments go to Simulation."""
+    def make(scheduled_arrival: float = 15.0, mean_service_time: float = 15.0, **options) -> Simulation:
+        options.setdefault("seed", 3)
+        return Simulation(8, scheduled_arrival, mean_service_time, TruncatedNormal(),
+                          Lognormal(desired_mean=mean_service_time), **options)
+    return make
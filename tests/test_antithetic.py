@@ -0,0 +1,28 @@
+import math
+from statistics import NormalDist
+import numpy as np
+import pytest
+
+RUNS = 2000
+
+@pytest.mark.parametrize("sampling", ["per_run", "batch"])
+def test_pairs_use_mirrored_normals(clinic, sampling):
+    sim = clinic(sampling=sampling, antithetic=True)
+    service_times, interarrival_deviation = sim._draw(sim._streams(RUNS, spawn=False))
+    service = sim.service_distribution
+    normals = (np.log(service_times) - service.mu) / service.sigma
+    np.testing.assert_allclose(normals[1::2], -normals[0::2], atol=1e-9)
+    # unpunctuality comes from the same normals as the service times of its run
+    np.testing.assert_allclose(interarrival_deviation[1::2], sim.iat_distribution.from_standard_normal(-normals[0::2]), atol=1e-9)
+
+def test_intervals_come_from_the_pair_means(clinic):
+    sim = clinic(sampling="batch", antithetic=True)
+    # never precise enough, so exactly RUNS runs
+    info = sim.simulate_until(rel_half_width=0.0, max_runs=RUNS)
+    costs = sim.run_costs()
+    pair_means = costs.reshape(-1, 2).mean(axis=1)
+    z = NormalDist().inv_cdf(0.975)
+    assert info["runs"] == RUNS
+    assert info["half_width"] == pytest.approx(z * pair_means.std(ddof=1) / math.sqrt(RUNS // 2))
+    # mirrored partners are negatively correlated: a pair varies less than two independent runs
+    assert pair_means.var(ddof=1) < costs.var(ddof=1) / 2
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+from cache import ResultCache
+
+RUNS = 2000
+
+def simulated(clinic, scheduled_arrival: float = 15.0):
+    sim = clinic(scheduled_arrival, sampling="batch")
+    sim.simulate(RUNS)
+    return sim
+
+def test_cached_runs_reload_identically(clinic, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    sim = simulated(clinic)
+    cache.save(sim, RUNS, spawn=False)
+
+    loaded = clinic(sampling="batch")
+    assert cache.load(loaded, RUNS, spawn=False) and cache.hits == 1
+    assert not cache.load(clinic(sampling="batch"), RUNS + 1000, spawn=False) and cache.misses == 1
+    assert loaded.streams_used == sim.streams_used
+    expected = sim.schedules.to_batch()
+    for name, values in loaded.schedules.to_batch().items():
+        assert values.dtype == expected[name].dtype
+        np.testing.assert_array_equal(values, expected[name], err_msg=name)
+    # later runs continue after the cached ones, as they would after simulating
+    sim.simulate(1000)
+    loaded.simulate(1000)
+    np.testing.assert_array_equal(loaded.schedules.service_end_times, sim.schedules.service_end_times)
+
+def test_eviction_drops_the_least_recently_used_entries(clinic, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    sims = [simulated(clinic, scheduled_arrival) for scheduled_arrival in (14.0, 15.0, 16.0)]
+    for age, sim in enumerate(sims):
+        cache.save(sim, RUNS, spawn=False)
+        path = cache._path(cache.key(sim, RUNS, False))
+        os.utime(path, (1000 + age, 1000 + age))
+    (tmp_path / "other.npz").write_bytes(b"not an entry")
+    entry_size = cache.nbytes // 3
+
+    # reading the oldest entry makes the second one the least recently used
+    assert cache.load(clinic(14.0, sampling="batch"), RUNS, spawn=False)
+    cache.max_bytes = 2 * entry_size
+    cache.evict()
+    assert cache.nbytes == 2 * entry_size
+    assert [cache.load(clinic(scheduled_arrival, sampling="batch"), RUNS, spawn=False)
+            for scheduled_arrival in (14.0, 15.0, 16.0)] == [True, False, True]
+
+    cache.clear()
+    assert cache.nbytes == 0
+    assert (tmp_path / "other.npz").exists()
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from optimisation import Optimisation
+
+RUNS = 2500  # chunks of 1000, 1000 and 500 runs per candidate
+
+def sweep(**options) -> Optimisation:
+    optimisation = Optimisation(range=(-1, 1), number_of_runs=RUNS, seed=5, sampling="batch", **options)
+    optimisation.optimise_for("scheduled_arrival")
+    return optimisation
+
+def runs(optimisation: Optimisation) -> list[dict[str, np.ndarray]]:
+    return [sim.schedules.to_batch() for sim in optimisation.simulations["scheduled_arrival"]]
+
+def test_resumed_sweep_equals_an_uninterrupted_one(tmp_path):
+    expected = runs(sweep())
+    sweep(checkpoint_dir=str(tmp_path))
+
+    parts = sorted(tmp_path.glob("*.npz"))
+    assert len(parts) == 9
+    # as if killed: one candidate lost its last chunk (500 runs), another all but its first (1500 runs)
+    for path in (parts[2], parts[4], parts[5]):
+        path.unlink()
+
+    resumed = sweep(checkpoint_dir=str(tmp_path), resume=True)
+    assert resumed.checkpoint.restored_runs == 3 * RUNS - 500 - 1500
+    for old, new in zip(expected, runs(resumed)):
+        assert old.keys() == new.keys()
+        for name in old:
+            np.testing.assert_array_equal(old[name], new[name], err_msg=name)
+
+def test_resume_with_other_parameters_is_refused(tmp_path):
+    Optimisation(range=(-1, 1), number_of_runs=RUNS, seed=5, checkpoint_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        Optimisation(range=(-1, 1), number_of_runs=RUNS, seed=6, checkpoint_dir=str(tmp_path), resume=True)
+
+def precision_sweep(**options) -> Optimisation:
+    optimisation = Optimisation(range=(-1, 1), number_of_runs=RUNS, seed=5, sampling="batch", **options)
+    # tight enough that some candidates stop early and others run to number_of_runs
+    optimisation.optimise_for("scheduled_arrival", rel_half_width=0.04)
+    return optimisation
+
+def test_resumed_precision_sweep_equals_an_uninterrupted_one(tmp_path):
+    expected = precision_sweep()
+    assert len({len(sim.schedules) for sim in expected.simulations["scheduled_arrival"]}) > 1
+    precision_sweep(checkpoint_dir=str(tmp_path))
+    for path in sorted(tmp_path.glob("*.npz"))[1::2]:
+        path.unlink()
+
+    resumed = precision_sweep(checkpoint_dir=str(tmp_path), resume=True)
+    assert resumed.checkpoint.restored_runs > 0
+    for old, new in zip(expected.simulations["scheduled_arrival"], resumed.simulations["scheduled_arrival"]):
+        assert old.precision_info == new.precision_info
+        for name, values in old.schedules.to_batch().items():
+            np.testing.assert_array_equal(values, new.schedules.to_batch()[name], err_msg=name)
+
+def test_precision_sweep_reads_back_cached_runs(tmp_path):
+    first = precision_sweep(cache_dir=str(tmp_path))
+    second = precision_sweep(cache_dir=str(tmp_path))
+    assert second.cache.hits == 3
+    for old, new in zip(first.simulations["scheduled_arrival"], second.simulations["scheduled_arrival"]):
+        assert len(old.schedules) == new.precision_info["runs"]
+        assert old.precision_info["converged"] == new.precision_info["converged"]
+        np.testing.assert_array_equal(old.run_costs(), new.run_costs())
+
+def test_fresh_checkpoint_leaves_other_files_alone(tmp_path):
+    sweep(cache_dir=str(tmp_path))
+    (tmp_path / "notes.json").write_text("{}")
+    shared = sweep(cache_dir=str(tmp_path), checkpoint_dir=str(tmp_path))
+    assert shared.cache.hits == 3
+    assert (tmp_path / "notes.json").exists()
+
+    sweep(checkpoint_dir=str(tmp_path))
+    sweep(checkpoint_dir=str(tmp_path))
+    assert shared.cache.load(shared.simulations["scheduled_arrival"][0], RUNS, False) is not None
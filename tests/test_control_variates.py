@@ -0,0 +1,34 @@
+import numpy as np
+
+RUNS = 2000
+
+def test_comparison_uses_the_stored_runs(clinic, monkeypatch):
+    sim = clinic(sampling="batch")
+    sim.simulate(RUNS)
+    components = sim.run_cost_components()
+
+    def no_new_runs(*args):
+        raise AssertionError("the comparison scheduled runs again")
+    monkeypatch.setattr(sim, "_schedule_batch", no_new_runs)
+    comparison = sim.comprehensive_control_variate_comparison(RUNS)
+
+    main = slice(comparison["pilot_size"], None)
+    assert comparison["idle"]["standard"]["mean"] == components[main, 0].mean()
+    np.testing.assert_allclose(comparison["waiting"]["standard"]["mean"],
+                               components[main, 1].mean() / sim.number_of_patients, rtol=1e-12)
+    np.testing.assert_allclose(comparison["cost"]["standard"]["mean"], sim.run_costs()[main].mean(), rtol=1e-12)
+
+def test_regression_estimate_is_unbiased_against_plain_monte_carlo(clinic):
+    # The estimate minus the plain mean of the same main runs is minus the fitted correction; over
+    # independent seeds it must average to zero, which it does not if a control is centred on a wrong mean
+    differences = []
+    for seed in range(40):
+        sim = clinic(sampling="batch", seed=seed)
+        sim.simulate(RUNS)
+        regression = sim.regression_control_variate_comparison(RUNS)
+        differences.append([regression[metric]["cv"]["mean"] - regression[metric]["standard"]["mean"]
+                            for metric in ("waiting", "idle", "overtime", "cost")])
+        assert all(regression[metric]["variance_reduction_percent"] > 30 for metric in ("waiting", "idle", "overtime", "cost"))
+    differences = np.array(differences)
+    standard_errors = differences.std(axis=0, ddof=1) / np.sqrt(len(differences))
+    assert np.all(np.abs(differences.mean(axis=0)) < 4 * standard_errors)
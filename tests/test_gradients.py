@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from schedule import ScheduleBatch
+
+RUNS = 400
+STEP = 1e-5
+# Off the kinks where a slot equals -TruncatedNormal.LOWER_BOUND (e.g. slot 2 at 15 minutes): unpunctuality
+# clipped at that bound puts the arrival exactly at 0, where the cost has one-sided slopes
+BASE = {"scheduled_arrival": 14.7, "mean_service_time": 14.5}
+
+@pytest.mark.parametrize("options", [{}, {"doctors": 2}, {"sampling": "batch"}])
+@pytest.mark.parametrize("parameter", ScheduleBatch.DERIVATIVE_PARAMETERS)
+def test_ipa_derivatives_match_central_differences(clinic, options, parameter):
+    sim = clinic(**BASE, **options)
+    sim.simulate(RUNS)
+    ipa = sim.run_cost_derivatives()[:, ScheduleBatch.DERIVATIVE_PARAMETERS.index(parameter)].mean(axis=0)
+
+    # Same seed, hence the same draws on both sides (common random numbers)
+    up = clinic(**{**BASE, parameter: BASE[parameter] + STEP}, **options)
+    down = clinic(**{**BASE, parameter: BASE[parameter] - STEP}, **options)
+    up.simulate(RUNS)
+    down.simulate(RUNS)
+    central = (up.run_cost_components().mean(axis=0) - down.run_cost_components().mean(axis=0)) / (2 * STEP)
+    np.testing.assert_allclose(ipa, central, rtol=1e-6, atol=1e-5)
+
+    total = sim.cost_gradient()[parameter]["total_cost"]["slope"]
+    assert total == pytest.approx(ipa @ np.asarray(sim.cost_params), rel=1e-9)
+
+@pytest.mark.parametrize("options", [{}, {"doctors": 2}])
+def test_slot_gradient_matches_finite_differences(clinic, options):
+    sim = clinic(**BASE, **options)
+    service_times, deviation = sim._draw(sim._streams(RUNS, spawn=False))
+    # uneven slots, as optimise_slots() produces them
+    slots = sim.appointment_slots() + np.random.default_rng(1).uniform(0.0, 3.0, sim.number_of_patients).cumsum()
+    slots[0] = 0.0
+    costs, gradient = sim.slot_costs(slots, service_times, deviation)
+
+    def mean_cost(moved: np.ndarray) -> float:
+        return float(sim.slot_costs(moved, service_times, deviation)[0].mean())
+
+    steps = np.eye(len(slots)) * STEP
+    differences = np.array([(mean_cost(slots + step) - mean_cost(slots - step)) / (2 * STEP) for step in steps])
+    # The first slot sits at 0, where arrivals stop being clipped: only the forward slope is defined
+    differences[0] = (mean_cost(slots + steps[0]) - costs.mean()) / STEP
+    np.testing.assert_allclose(gradient, differences, rtol=1e-5, atol=1e-5)
@@ -0,0 +1,25 @@
+import math
+import numpy as np
+
+LEVEL = 60.0  # an hour of overtime: about one run in twenty
+
+def test_tilted_tail_probability_matches_plain_monte_carlo(clinic):
+    plain = clinic(sampling="batch")
+    plain.simulate(20000)
+    expected = plain.tail_probability("overtime", LEVEL)
+
+    tilted = clinic(sampling="batch", tilt=plain.choose_tilt("overtime", LEVEL))
+    tilted.simulate(5000)
+    estimate = tilted.tail_probability("overtime", LEVEL)
+    assert estimate["hits"] > 2 * expected["hits"]
+    assert abs(estimate["probability"] - expected["probability"]) < estimate["half_width"] + expected["half_width"]
+
+def test_likelihood_ratios_average_to_one(clinic):
+    runs, tilt = 20000, 0.1
+    sim = clinic(sampling="batch", tilt=tilt)
+    sim.simulate(runs)
+    weights = sim.schedules.likelihood_ratios
+    # the ratio of n shifted normals has mean 1 and variance exp(n * tilt^2) - 1
+    standard_error = math.sqrt(math.expm1(sim.number_of_patients * tilt ** 2) / runs)
+    assert abs(weights.mean() - 1) < 4 * standard_error
+    assert np.all(clinic(sampling="batch").simulate(1000).likelihood_ratios == 1)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from schedule import Schedule, multi_server_batch
+
+RUNS = 500
+
+def batch_and_per_run(sim):
+    """The stored schedules of RUNS runs of sim, and the same draws scheduled run by run with Schedule.setup_schedule."""
+    service_times, interarrival_deviation = sim._draw(sim._streams(RUNS, spawn=False))
+    sim._store_batch(sim._schedule_batch(service_times, interarrival_deviation))
+    per_run = []
+    for service, deviation in zip(service_times, interarrival_deviation):
+        schedule = Schedule(sim.working_hours, sim.scheduled_arrival, sim.appointment_times)
+        schedule.setup_schedule(sim.appointment_slots() + deviation, service,
+                                servers=sim.doctors, queue_capacity=sim.queue_capacity)
+        per_run.append(schedule)
+    return sim.schedules, per_run
+
+# Slots shorter than, equal to and longer than the mean service: queues and overtime, both, idle doctors
+@pytest.mark.parametrize("scheduled_arrival", [12.0, 15.0, 18.0])
+def test_lindley_batch_matches_the_per_run_schedule(clinic, scheduled_arrival):
+    schedules, per_run = batch_and_per_run(clinic(scheduled_arrival, sampling="batch"))
+    assert schedules.overtime_times.any() and (schedules.waiting_times > 0).any()
+    for run, schedule in enumerate(per_run):
+        np.testing.assert_array_equal(schedules.arrival_times[run], schedule.arrival_times)
+        np.testing.assert_array_equal(schedules.service_start_times[run], schedule.service_start_times)
+        np.testing.assert_array_equal(schedules.service_end_times[run], schedule.service_end_times)
+        np.testing.assert_array_equal(schedules.waiting_times[run], schedule.to_dataframe()["waiting_time"])
+        np.testing.assert_array_equal(schedules.doctor_idle_times[run], schedule.doctor_idle_times)
+        np.testing.assert_array_equal(schedules.doctor_overtime_times[run], schedule.doctor_overtime_times)
+
+@pytest.mark.parametrize("doctors", [2, 3, 6])
+@pytest.mark.parametrize("queue_capacity", [float("inf"), 2])
+def test_multi_server_batch_matches_the_per_run_schedule(clinic, doctors, queue_capacity):
+    # A quarter more bookings than the doctors can see in 8 hours: queues, overtime and, with a finite queue, drops
+    slots = np.arange(0.0, 480.0, 12.0 / doctors)
+    schedules, per_run = batch_and_per_run(clinic(sampling="batch", doctors=doctors, queue_capacity=queue_capacity,
+                                                  appointment_times=slots))
+    assert ((schedules.doctor_overtime_times > 0).sum(axis=1) > 1).any()
+    assert np.isnan(schedules.service_start_times).any() == (queue_capacity < float("inf"))
+    for run, schedule in enumerate(per_run):
+        served = ~np.isnan(schedules.service_start_times[run])
+        np.testing.assert_array_equal(schedules.arrival_times[run], schedule.arrival_times)
+        np.testing.assert_array_equal(schedules.service_start_times[run][served], schedule.service_start_times)
+        np.testing.assert_array_equal(schedules.service_end_times[run][served], schedule.service_end_times)
+        np.testing.assert_array_equal(schedules.doctor_idle_times[run], schedule.doctor_idle_times)
+        np.testing.assert_array_equal(schedules.doctor_overtime_times[run], schedule.doctor_overtime_times)
+        if served.all():
+            np.testing.assert_array_equal(schedules.waiting_times[run], schedule.to_dataframe()["waiting_time"])
+
+def test_multi_server_batch_breaks_ties_and_drops_like_the_heap():
+    # Both doctors are free at 5; the heap hands patient 2 to doctor 0, who is then idle from 5 to 8
+    arrivals = np.array([[0.0, 0.0, 8.0], [0.0, 1.0, 2.0]])
+    services = np.array([[5.0, 5.0, 1.0], [5.0, 5.0, 5.0]])
+    result = multi_server_batch(arrivals, services, servers=2)
+    np.testing.assert_array_equal(result["doctor_idle_times"][0], [3.0, 0.0])
+    # With room for nobody waiting, the third patient of the second run arrives to two busy doctors
+    dropped = multi_server_batch(arrivals, services, servers=2, queue_capacity=0)
+    np.testing.assert_array_equal(dropped["service_start_times"][1], [0.0, 1.0, np.nan])
+    np.testing.assert_array_equal(dropped["service_end_times"][1], [5.0, 6.0, np.nan])
+    for run in range(2):
+        for capacity, batch in ((float("inf"), result), (0, dropped)):
+            schedule = Schedule()
+            schedule.setup_schedule(arrivals[run], services[run], servers=2, queue_capacity=capacity)
+            session_end = np.nanmax(batch["service_end_times"][run])
+            np.testing.assert_array_equal(batch["doctor_idle_times"][run] + session_end - batch["doctor_free_times"][run],
+                                          schedule.doctor_idle_times)
@@ -0,0 +1,38 @@
+import pytest
+from optimisation import Optimisation
+
+# Sweeps over mean_service_time (where the candidates see different numbers of patients, so
+# common random numbers pair them loosely) that take several stages and change their best on the way
+SELECTIONS = [
+    dict(number_of_doctors=2, mean_service_time=31.0, scheduled_arrival=14.0, cost_params=(1.0, 0.113, 2.91), seed=42, sampling="batch"),
+    dict(mean_service_time=15.5, scheduled_arrival=17.0, cost_params=(1.0, 0.486, 2.66), seed=90, sampling="per_run"),
+    dict(mean_service_time=15.5, scheduled_arrival=16.0, cost_params=(1.0, 0.402, 0.345), seed=61, sampling="per_run"),
+]
+
+@pytest.mark.parametrize("options", SELECTIONS)
+def test_select_best_pairs_every_competitor_run(options):
+    optimisation = Optimisation(range=(-3, 3), number_of_runs=3000, **options)
+    best = optimisation.select_best("mean_service_time", initial_runs=50, stage_runs=300)
+
+    allocations = optimisation.allocations["mean_service_time"]
+    survivors = optimisation.survivors["mean_service_time"]
+    assert best.mean_service_time in survivors
+    assert sum(allocations.values()) > 7 * 50
+    for value in survivors:
+        assert allocations[best.mean_service_time] >= allocations[value]
+    # The best was topped up whenever it changed, and dropped candidates stopped getting runs
+    assert allocations[best.mean_service_time] == max(allocations.values())
+
+def test_run_counts_are_rounded_to_whole_rqmc_replications():
+    optimisation = Optimisation(sampling="rqmc")
+    assert optimisation.number_of_runs == 10112  # 10000 rounded up to 79 point sets of 128
+
+def test_rqmc_sweeps_and_selection_run():
+    optimisation = Optimisation(range=(-1, 1), number_of_runs=300, seed=1, sampling="rqmc")
+    optimisation.optimise_for("scheduled_arrival")
+    assert [len(sim.schedules) for sim in optimisation.simulations["scheduled_arrival"]] == [384] * 3
+
+    best = optimisation.select_best("mean_service_time", initial_runs=100, stage_runs=500)
+    for runs in optimisation.allocations["mean_service_time"].values():
+        assert runs % 128 == 0
+    assert 256 <= len(best.schedules) <= 384
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from schedule import PrefixSchedule, multi_server_batch
+
+RUNS = 300
+CLINICS = [
+    {"doctors": 1},
+    {"doctors": 2},
+    {"doctors": 2, "queue_capacity": 3},
+]
+
+def draws(sim):
+    return sim._draw(sim._streams(RUNS, spawn=False))
+
+@pytest.mark.parametrize("options", CLINICS)
+def test_reschedule_matches_a_fresh_sweep(clinic, options):
+    sim = clinic(**options)
+    service_times, deviation = draws(sim)
+    slots = sim.appointment_slots()
+    prefix = sim.prefix_schedule(slots, service_times, deviation)
+
+    late = slots.copy()
+    late[24:] += 5.0
+    early = slots.copy()
+    early[10:] -= 2.0
+    # moved back and forth: the stored state must stay consistent between calls
+    for moved in (late, early, slots, late):
+        expected, _ = sim.slot_costs(moved, service_times, deviation)
+        np.testing.assert_allclose(sim.reschedule(prefix, moved, deviation), expected, rtol=1e-12, atol=1e-9)
+
+@pytest.mark.parametrize("options", CLINICS)
+@pytest.mark.parametrize("k", [0, 16, 31])
+def test_reevaluate_from_matches_a_full_sweep(clinic, options, k):
+    sim = clinic(**options)
+    service_times, deviation = draws(sim)
+    arrivals = np.sort(np.maximum(sim.appointment_slots() + deviation, 0.0), axis=1)
+    servers, capacity = sim.doctors, sim.queue_capacity
+    prefix = PrefixSchedule(arrivals, service_times, servers=servers, queue_capacity=capacity)
+
+    moved = arrivals.copy()
+    moved[:, k:] += 3.0
+    result = prefix.reevaluate_from(k, moved[:, k:])
+    fresh = multi_server_batch(moved, service_times, servers=servers, queue_capacity=capacity)
+    for key in ("service_start_times", "service_end_times"):
+        np.testing.assert_array_equal(result[key], fresh[key], err_msg=key)
+    for key in ("doctor_idle_times", "doctor_free_times"):
+        np.testing.assert_allclose(result[key], fresh[key], rtol=1e-12, atol=1e-9, err_msg=key)
+    if k:
+        # the prefix before patient k is not swept again
+        assert prefix.patients_swept <= RUNS * (sim.number_of_patients + sim.number_of_patients - k)
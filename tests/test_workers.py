@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+# More than Simulation.RUNS_PER_STREAM, so the runs are split into several chunks
+RUNS = 2500
+
+def assert_same_runs(a, b):
+    first, second = a.schedules.to_batch(), b.schedules.to_batch()
+    assert first.keys() == second.keys()
+    for name in first:
+        np.testing.assert_array_equal(first[name], second[name], err_msg=name)
+
+@pytest.mark.parametrize("options", [{"sampling": "batch"}, {"sampling": "batch", "doctors": 2, "queue_capacity": 4}])
+def test_batch_sampling_is_the_same_serial_and_in_a_pool(clinic, options):
+    serial, pooled = clinic(**options), clinic(**options)
+    serial.simulate(RUNS)
+    pooled.simulate(RUNS, workers=2)
+    assert_same_runs(serial, pooled)
+
+def test_pooled_runs_do_not_depend_on_the_worker_count(clinic):
+    one, two = clinic(), clinic()
+    one.simulate(RUNS, workers=1)
+    two.simulate(RUNS, workers=2)
+    assert_same_runs(one, two)
+
+def test_continued_runs_equal_one_call(clinic):
+    split, whole = clinic(), clinic()
+    split.simulate(300)
+    split.simulate(200)
+    whole.simulate(500)
+    assert_same_runs(split, whole)
+
+def test_simulate_until_keeps_one_pool_busy(clinic, monkeypatch):
+    import simulation
+    pools = []
+
+    class CountingPool(simulation.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            pools.append(self)
+
+    monkeypatch.setattr(simulation, "ProcessPoolExecutor", CountingPool)
+    pooled, serial = clinic(sampling="batch"), clinic(sampling="batch")
+    # unreachable precision: batches of 2 workers x RUNS_PER_STREAM runs up to max_runs
+    info = pooled.simulate_until(rel_half_width=1e-9, max_runs=4000, batch_runs=500, workers=2)
+    serial.simulate(4000)
+    assert info["runs"] == 4000 and len(pools) == 1
+    assert_same_runs(pooled, serial)
@@ -1,7 +1,8 @@
 import matplotlib.pyplot as plt
 import numpy as np
 from typing import Any, Optional
-from optimisation import Optimisation
+from optimisation import Optimisation, SweepGrid
+from summary import weighted_percentile
 from matplotlib.axes import Axes
 from matplotlib.figure import Figure
 import os
@@ -124,14 +125,30 @@ class ClinicVisualization:
         if ax is None:
             _fig, ax = plt.subplots(figsize=self.config['figsize'])
 
-        waiting_times: list[float] = self.opt_sim.summaries.waiting_times.arr
+        section = self.opt_sim.summaries.waiting_times
+        if section.sketch is not None:
+            # Streamed simulation: plot the sketch buckets (weighted by their counts)
+            waiting_times = section.sketch.bucket_values()
+            weights = section.sketch.bucket_counts()
+            _n, bins, _patches = ax.hist(waiting_times, bins=bins, weights=weights, alpha=0.7, color=self.colors[0], edgecolor='black', density=True)
+            mean_wait = float(self.opt_sim.summaries.patient_metrics.avg_waiting_time)
+            percentile_95 = section.sketch.percentile(95)
+            percentile_100 = float(self.opt_sim.summaries.patient_metrics.max_waiting_time)
+        else:
+            waiting_times = section.arr
+            # Importance-sampled runs: weighted by their likelihood ratios, so the plot shows the nominal distribution
+            weights = section.weights
 
-        _n, bins, _patches = ax.hist(waiting_times, bins=bins, alpha=0.7, color=self.colors[0], edgecolor='black', density=True)
-        
-        # Add statistical lines
-        mean_wait = float(np.mean(waiting_times))
-        percentile_95 = float(np.percentile(waiting_times, 95))
-        percentile_100 = float(np.max(waiting_times))
+            _n, bins, _patches = ax.hist(waiting_times, bins=bins, weights=weights, alpha=0.7, color=self.colors[0], edgecolor='black', density=True)
+
+            # Add statistical lines
+            if weights is None:
+                mean_wait = float(np.mean(waiting_times))
+                percentile_95 = float(np.percentile(waiting_times, 95))
+            else:
+                mean_wait = float(np.average(waiting_times, weights=weights))
+                percentile_95 = weighted_percentile(np.asarray(waiting_times), np.asarray(weights), 95)
+            percentile_100 = float(np.max(waiting_times))
 
         ax.axvline(mean_wait, color='red', linestyle='--', linewidth=2, label=f'Mean: {mean_wait:.1f} min')
         ax.axvline(percentile_95, color='orange', linestyle='--', linewidth=2, label=f'95th %ile: {percentile_95:.1f} min')
@@ -322,6 +339,39 @@ class ClinicVisualization:
 
         return ax
 
+    @staticmethod
+    def plot_cost_heatmap(grid: SweepGrid, ax: Optional[Axes] = None) -> Axes:
+        """
+        Heat map of total cost over a 2-D grid from Optimisation.optimise_grid / optimise_2d,
+        with every cell annotated and the optimum outlined.
+        """
+        if len(grid.variables) != 2:
+            raise ValueError("A cost heat map needs a 2-D grid.")
+        if ax is None:
+            _fig, ax = plt.subplots(figsize=(10, 6))
+
+        y_var, x_var = grid.variables
+        image = ax.imshow(grid.costs, cmap='viridis_r', aspect='auto', origin='lower')
+        plt.colorbar(image, ax=ax, label='Total Cost ($)')
+        ax.set_xticks(range(len(grid.values[1])))
+        ax.set_xticklabels([f"{x:g}" for x in grid.values[1]])
+        ax.set_yticks(range(len(grid.values[0])))
+        ax.set_yticklabels([f"{y:g}" for y in grid.values[0]])
+        ax.set_xlabel(x_var.replace('_', ' ').title(), fontsize=12)
+        ax.set_ylabel(y_var.replace('_', ' ').title(), fontsize=12)
+        ax.set_title(f"Total Cost by {y_var.replace('_', ' ').title()} and {x_var.replace('_', ' ').title()}", fontsize=14)
+
+        # dark text on the light (cheap) cells, light text on the dark ones
+        midpoint = (np.nanmin(grid.costs) + np.nanmax(grid.costs)) / 2
+        for (row, col), cost in np.ndenumerate(grid.costs):
+            ax.annotate(f"{cost:.1f}", (col, row), ha='center', va='center', fontsize=9,
+                        color='black' if cost < midpoint else 'white')
+        row, col = np.unravel_index(np.nanargmin(grid.costs), grid.costs.shape)
+        ax.add_patch(plt.Rectangle((col - 0.5, row - 0.5), 1, 1, fill=False, edgecolor='red', linewidth=2))
+        ax.grid(False)
+
+        return ax
+
     def save_figure(self, fig: Figure, filename: str) -> None:
         """Save one Figure to filename. Creates directories as needed."""
         dirname = os.path.dirname(filename)